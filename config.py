@@ -8,13 +8,27 @@ DATA_DIR = BASE_DIR / "data"
 DOCUMENTS_DIR = DATA_DIR / "documents"
 VECTORDB_DIR = DATA_DIR / "vectordb"
 CHAT_HISTORY_DIR = DATA_DIR / "chat_history"
+PDF_CACHE_DIR = DATA_DIR / "pdf_cache"
 
-for dir_path in [DATA_DIR, DOCUMENTS_DIR, VECTORDB_DIR, CHAT_HISTORY_DIR]:
+for dir_path in [DATA_DIR, DOCUMENTS_DIR, VECTORDB_DIR, CHAT_HISTORY_DIR, PDF_CACHE_DIR]:
     dir_path.mkdir(parents=True, exist_ok=True)
 
 OLLAMA_BASE_URL = "http://localhost:11434"
 DEFAULT_MODEL = "llama3.1:8b"
 TEMPERATURE = 0.7
+OLLAMA_KEEP_ALIVE = "30m"
+OLLAMA_CONNECT_TIMEOUT = 5
+OLLAMA_READ_TIMEOUT = 3600
+# Keep in line with the server's OLLAMA_NUM_PARALLEL
+OLLAMA_MAX_PARALLEL = 4
+MODELS_CACHE_TTL = 60
+# Gzip request bodies; only useful behind a proxy that decompresses them
+OLLAMA_GZIP_REQUESTS = False
+
+# Exact-match cache of LLM answers keyed on model, temperature and full prompt.
+# Only used when the temperature is 0; sampled answers are never replayed
+ENABLE_RESPONSE_CACHE = True
+RESPONSE_CACHE_SIZE = 512
 
 PERSIST_DIRECTORY = str(VECTORDB_DIR)
 # COLLECTION_NAME = "rag_documents"
@@ -26,16 +40,48 @@ def generate_collection_name(prefix="rag_collection"):
 
 RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
 ENABLE_RERANKER = True
+RERANKER_BATCH_SIZE = 32
 
 # Thêm cấu hình hybrid search
 ENABLE_HYBRID_SEARCH = True
 HYBRID_ALPHA = 0.7
+RRF_K = 60
+HYBRID_CANDIDATE_MARGIN = 5
+
+# VectorRetriever.search result cache (0 disables it)
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_TTL = 300
 
 MAX_CHAT_HISTORY = 10
 
+# Query cache: exact-match embedding LRU + semantic cache for retrieved docs
+ENABLE_SEMANTIC_CACHE = True
+EMBEDDING_CACHE_SIZE = 1024
+SEMANTIC_CACHE_SIZE = 512
+SEMANTIC_CACHE_THRESHOLD = 0.97
+
 SUPPORTED_EXTENSIONS = ['.pdf']
+# Per-file limit for web uploads, checked before anything is written to disk
+MAX_UPLOAD_SIZE_MB = 100
+# Worker processes used to parse PDFs in parallel (1 disables the pool); capped
+# because each spawn worker loads PyMuPDF and OCR and reopens the PDF per task
+DOCUMENT_LOADER_WORKERS = min(os.cpu_count() or 1, 6)
+# Smallest page range handed to a worker when a single PDF is split across
+# the pool; larger PDFs get one contiguous range per worker
+PDF_PAGES_PER_TASK = 4
+# OCR results for repeated images (logos, page frames), keyed by image hash
+OCR_CACHE_SIZE = 1024
+# Reuse parsed PDFs across runs, keyed by a hash of the file bytes
+ENABLE_PDF_CACHE = True
+# Least recently used entries are evicted once the cache grows past this
+PDF_CACHE_MAX_MB = 1024
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+EMBEDDING_BATCH_SIZE = 64
+# Chunk embeddings keyed by model + content hash, reused across ingests
+ENABLE_CHUNK_EMBEDDING_CACHE = True
+CHUNK_EMBEDDING_CACHE_PATH = DATA_DIR / "embedding_cache.sqlite"
+CHROMA_ADD_BATCH_SIZE = 250
 # EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 # EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
 # EMBEDDING_MODEL = "nomic-ai/nomic-embed-text-v1.5"
@@ -1,9 +1,9 @@
 import argparse
+import atexit
 import sys
 from pathlib import Path
 import logging
 
-from rag.chatbot import RAGChatbot
 from config import DOCUMENTS_DIR
 
 logging.basicConfig(
@@ -13,6 +13,23 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+STREAM_FLUSH_BYTES = 64
+
+
+def stream_to_stdout(chunks):
+    # Flush on word boundaries instead of once per token
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) > STREAM_FLUSH_BYTES or any(c in buffer for c in " \n\t"):
+            sys.stdout.write(buffer)
+            sys.stdout.flush()
+            buffer = ""
+    if buffer:
+        sys.stdout.write(buffer)
+        sys.stdout.flush()
+
+
 def main():
     parser = argparse.ArgumentParser(description="RAG Chatbot")
     parser.add_argument(
@@ -38,7 +55,12 @@ def main():
         subprocess.run(["streamlit", "run", "web/streamlit_app.py"])
         return
 
+    # Imported here so --help and --web don't load torch, the embedding
+    # model stack and chromadb
+    from rag.chatbot import RAGChatbot
+
     chatbot = RAGChatbot()
+    atexit.register(chatbot.close)
 
     if args.clear_db:
         print("Clearing vector database...")
@@ -102,7 +124,8 @@ def main():
                 print(f"\nRelevant sources for: '{query}'")
                 for i, source in enumerate(sources, 1):
                     print(f"{i}. {source['metadata'].get('filename', 'Unknown')}")
-                    print(f"   Distance: {source.get('distance', 'N/A'):.4f}")
+                    distance = source.get('distance')
+                    print(f"   Distance: {'N/A' if distance is None else f'{distance:.4f}'}")
                     print(f"   Content preview: {source['content'][:100]}...")
                 continue
 
@@ -110,9 +133,7 @@ def main():
                 continue
 
             print("\nBot: ", end="", flush=True)
-
-            for chunk in chatbot.stream_chat(user_input):
-                print(chunk, end="", flush=True)
+            stream_to_stdout(chatbot.stream_chat(user_input))
             print()  
 
         except KeyboardInterrupt:
@@ -1,5 +1,10 @@
+import logging
+
 from .retriever import VectorRetriever
 from .llm import OllamaLLM
 from .chatbot import RAGChatbot
 
-__all__ = ['VectorRetriever', 'OllamaLLM', 'RAGChatbot']
\ No newline at end of file
+__all__ = ['VectorRetriever', 'OllamaLLM', 'RAGChatbot']
+
+# Libraries leave handler setup to the application (main.py, streamlit_app.py)
+logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -1,18 +1,26 @@
 # chatbot.py
-import json
 import os
+import queue
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 from pathlib import Path
 
-from utils.reranker import Reranker
+import numpy as np
+import orjson
+
+from utils.reranker import get_reranker
 from config import ENABLE_RERANKER, RERANKER_MODEL, ENABLE_HYBRID_SEARCH
-from utils import DocumentLoader, TextProcessor, EmbeddingManager
+from utils import DocumentLoader, TextProcessor, get_embedding_manager
 from rag.retriever import VectorRetriever
-from rag.llm import OllamaLLM
-from config import CHAT_HISTORY_DIR, MAX_CHAT_HISTORY
+from rag.llm import OllamaLLM, format_source_info, PROMPT_HISTORY_TURNS
+from config import CHAT_HISTORY_DIR, MAX_CHAT_HISTORY, EMBEDDING_BATCH_SIZE
+from config import (ENABLE_SEMANTIC_CACHE, EMBEDDING_CACHE_SIZE,
+                    SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD)
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -20,14 +28,24 @@ class RAGChatbot:
     def __init__(self, collection_name=None):
         self.document_loader = DocumentLoader()
         self.text_processor = TextProcessor()
-        self.embedding_manager = EmbeddingManager()
+        self.embedding_manager = get_embedding_manager()
         self.retriever = VectorRetriever(collection_name=collection_name)
         self.llm = OllamaLLM()
-        self.reranker = Reranker(RERANKER_MODEL) if ENABLE_RERANKER else None
-        self.chat_history = []
-        self.conversation_context = []
+        self.reranker = get_reranker(RERANKER_MODEL) if ENABLE_RERANKER else None
+        self.chat_history = deque(maxlen=MAX_CHAT_HISTORY)
         self.session_id = None
         self.is_initialized = False
+        self._embedding_cache = OrderedDict()
+        self._semantic_cache = OrderedDict()
+        # Cached query vectors live in one preallocated float32 matrix; rows
+        # 0..len(_semantic_cache)-1 are always occupied
+        self._semantic_matrix = None
+        self._semantic_slot_keys = [None] * SEMANTIC_CACHE_SIZE
+        self._last_query = None
+        # The chatbot is shared across Streamlit sessions; guards the three
+        # query caches above
+        self._cache_lock = threading.Lock()
+        self._prompt_executor = ThreadPoolExecutor(max_workers=1)
 
         logger.info("RAG Chatbot initialized successfully")
 
@@ -35,69 +53,212 @@ class RAGChatbot:
         try:
             logger.info(f"Loading documents from: {document_path}")
 
-            if os.path.isfile(document_path):
-                documents = [self.document_loader.load_document(document_path)]
+            if isinstance(document_path, (list, tuple)):
+                file_paths = list(document_path)
+            elif os.path.isfile(document_path):
+                file_paths = [document_path]
             else:
-                documents = self.document_loader.load_documents(document_path)
+                file_paths = self.document_loader.list_documents(document_path)
 
-            if not documents:
+            if not file_paths:
                 logger.warning("No documents found to load")
                 return False
 
-            logger.info("Processing documents into chunks...")
-            chunks = self.text_processor.process_documents(documents)
+            # Parse PDFs in a worker thread while the main thread embeds
+            # the chunk batches it has already produced.
+            batch_queue = queue.Queue(maxsize=4)
+            stop_event = threading.Event()
+            chunks = []
+            embeddings = []
+
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                producer = executor.submit(
+                    self._produce_chunk_batches, file_paths, batch_queue, stop_event
+                )
+                try:
+                    while True:
+                        batch = batch_queue.get()
+                        if batch is None:
+                            break
+                        embeddings.append(self.embedding_manager.embed_batch(
+                            [chunk['content'] for chunk in batch]
+                        ))
+                        chunks.extend(batch)
+                except Exception:
+                    stop_event.set()
+                    while batch_queue.get() is not None:
+                        pass
+                    raise
+                document_count = producer.result()
+
+            if not document_count:
+                logger.warning("No documents found to load")
+                return False
 
             if not chunks:
                 logger.warning("No chunks created from documents")
                 return False
 
-            logger.info("Generating embeddings...")
-            embedded_chunks = self.embedding_manager.embed_documents(chunks)
+            embedding_matrix = np.concatenate(embeddings)
+            for chunk, embedding in zip(chunks, embedding_matrix):
+                chunk['embedding'] = embedding
 
             logger.info("Adding documents to vector database...")
-            self.retriever.add_documents(embedded_chunks)
+            self.retriever.add_documents(chunks)
+            self._clear_query_cache()
 
             self.is_initialized = True
-            logger.info(f"Successfully loaded {len(documents)} documents with {len(chunks)} chunks")
+            logger.info(f"Successfully loaded {document_count} documents with {len(chunks)} chunks")
             return True
 
         except Exception as e:
             logger.error(f"Error loading documents: {str(e)}")
             return False
 
-    def _build_conversation_context(self, current_query, window_size = 3):
-        if not self.chat_history:
-            return current_query
-
-        # Lấy các exchange gần nhất
-        recent_exchanges = self.chat_history[-window_size:]
-        
-        context_parts = []
-        for exchange in recent_exchanges:
-            context_parts.append(f"User: {exchange.get('human', '')}")
-            context_parts.append(f"Assistant: {exchange.get('assistant', '')}")
-        
-        context_parts.append(f"Current Question: {current_query}")
-        return "\n".join(context_parts)
-    
+    def _produce_chunk_batches(self, file_paths, batch_queue, stop_event):
+        document_count = 0
+        chunk_offset = 0
+        try:
+            for file_path, document in self.document_loader.iter_documents(file_paths):
+                if stop_event.is_set():
+                    break
+
+                if document is None:
+                    continue
+
+                document_count += 1
+                chunks = self.text_processor.process_documents([document])
+                for chunk in chunks:
+                    metadata = chunk['metadata']
+                    metadata['global_chunk_id'] += chunk_offset
+                    metadata['prompt_header'] = format_source_info(metadata)
+                chunk_offset += len(chunks)
+
+                for start in range(0, len(chunks), EMBEDDING_BATCH_SIZE):
+                    batch_queue.put(chunks[start:start + EMBEDDING_BATCH_SIZE])
+        finally:
+            batch_queue.put(None)
+
+        return document_count
+
+    @staticmethod
+    def _normalize_query(text):
+        return unicodedata.normalize('NFKC', text).strip().lower()
+
+    def _embed_query(self, user_message):
+        if not ENABLE_SEMANTIC_CACHE:
+            return self.embedding_manager.embed_text(user_message)
+
+        key = self._normalize_query(user_message)
+        with self._cache_lock:
+            embedding = self._embedding_cache.get(key)
+            if embedding is not None:
+                self._embedding_cache.move_to_end(key)
+                return embedding
+
+        embedding = self.embedding_manager.embed_text(user_message)
+        with self._cache_lock:
+            self._embedding_cache[key] = embedding
+            self._embedding_cache.move_to_end(key)
+            if len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+                self._embedding_cache.popitem(last=False)
+        return embedding
+
+    def _lookup_semantic_cache(self, query_vector, top_k):
+        with self._cache_lock:
+            if not self._semantic_cache:
+                return None
+
+            # Embeddings are L2-normalized, so cosine similarity is a dot product
+            sims = self._semantic_matrix[:len(self._semantic_cache)] @ query_vector
+
+            best = int(np.argmax(sims))
+            if sims[best] < SEMANTIC_CACHE_THRESHOLD:
+                return None
+
+            key = self._semantic_slot_keys[best]
+            _, cached_top_k, docs = self._semantic_cache[key]
+            if cached_top_k != top_k:
+                return None
+
+            self._semantic_cache.move_to_end(key)
+            logger.info(f"Semantic cache hit (similarity {sims[best]:.3f})")
+            return docs
+
+    def _store_semantic_cache(self, user_message, query_vector, top_k, docs):
+        key = self._normalize_query(user_message)
+        with self._cache_lock:
+            entry = self._semantic_cache.get(key)
+            if entry is not None:
+                slot = entry[0]
+            elif len(self._semantic_cache) >= SEMANTIC_CACHE_SIZE:
+                # Reuse the least recently used entry's row
+                _, (slot, _, _) = self._semantic_cache.popitem(last=False)
+            else:
+                slot = len(self._semantic_cache)
+
+            if self._semantic_matrix is None:
+                self._semantic_matrix = np.empty((SEMANTIC_CACHE_SIZE, query_vector.shape[0]), dtype=np.float32)
+            self._semantic_matrix[slot] = query_vector
+            self._semantic_slot_keys[slot] = key
+            self._semantic_cache[key] = (slot, top_k, docs)
+            self._semantic_cache.move_to_end(key)
+
+    def _clear_query_cache(self):
+        with self._cache_lock:
+            self._embedding_cache.clear()
+            self._semantic_cache.clear()
+            self._last_query = None
+
+    def _retrieve(self, user_message, top_k):
+        # Reuse the previous turn's results when the same question is asked
+        # again, e.g. `sources <query>` followed by the query itself.
+        with self._cache_lock:
+            last_query = self._last_query
+        if last_query is not None:
+            last_message, last_top_k, last_docs = last_query
+            if last_message == user_message and last_top_k >= top_k:
+                return last_docs[:top_k]
+
+        relevant_docs = self._retrieve_uncached(user_message, top_k)
+        with self._cache_lock:
+            self._last_query = (user_message, top_k, relevant_docs)
+        return relevant_docs
+
+    def _retrieve_uncached(self, user_message, top_k):
+        query_embedding = self._embed_query(user_message)
+
+        if ENABLE_SEMANTIC_CACHE:
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            cached_docs = self._lookup_semantic_cache(query_vector, top_k)
+            if cached_docs is not None:
+                return cached_docs
+
+        relevant_docs = self.retriever.search(
+            query_embedding,
+            query_text=user_message,
+            top_k=top_k * 2,  # Lấy nhiều hơn để re-rank
+            use_hybrid=ENABLE_HYBRID_SEARCH
+        )
+
+        if self.reranker and self.reranker.is_available():
+            relevant_docs = self.reranker.rerank(user_message, relevant_docs, top_k)
+        else:
+            relevant_docs = relevant_docs[:top_k]
+
+        if ENABLE_SEMANTIC_CACHE:
+            self._store_semantic_cache(user_message, query_vector, top_k, relevant_docs)
+
+        return relevant_docs
+
     def chat(self, user_message, top_k=5):
         try:
             if not self.is_initialized:
                 return "Please load documents first before asking questions."
 
-            conversation_context = self._build_conversation_context(user_message)
-            query_embedding = self.embedding_manager.embed_text(user_message)
-            relevant_docs = self.retriever.search(
-                query_embedding, 
-                query_text=user_message,  
-                top_k=top_k * 2,  # Lấy nhiều hơn để re-rank
-                use_hybrid=ENABLE_HYBRID_SEARCH
-            )
-
-            if self.reranker and self.reranker.is_available():
-                relevant_docs = self.reranker.rerank(user_message, relevant_docs, top_k)
-            else:
-                relevant_docs = relevant_docs[:top_k]
+            # Build the system + history prefix while retrieval and reranking run
+            prefix_future = self._prompt_executor.submit(self.llm.build_prefix, self._history_tail())
+            relevant_docs = self._retrieve(user_message, top_k)
 
             # Prepare context with both content and metadata 
             context = []
@@ -113,7 +274,7 @@ class RAGChatbot:
                 prompt=user_message,
                 context=context,
                 chat_history=self.chat_history,
-                conversation_context=conversation_context
+                prefix=prefix_future.result()
             )
 
             self._update_chat_history(user_message, response, relevant_docs)
@@ -124,25 +285,21 @@ class RAGChatbot:
             logger.error(f"Error in chat: {str(e)}")
             return "Sorry, I encountered an error while processing your question."
 
-    def stream_chat(self, user_message, top_k=5):
+    def stream_chat(self, user_message, top_k=5, context=None):
         try:
             if not self.is_initialized:
                 yield "Please load documents first before asking questions."
                 return
 
-            conversation_context = self._build_conversation_context(user_message)
-            query_embedding = self.embedding_manager.embed_text(user_message)
-            relevant_docs = self.retriever.search(
-                query_embedding,
-                query_text=user_message,
-                top_k=top_k * 2,
-                use_hybrid=ENABLE_HYBRID_SEARCH
-            )
-
-            if self.reranker and self.reranker.is_available():
-                relevant_docs = self.reranker.rerank(user_message, relevant_docs, top_k)
+            # Build the system + history prefix while retrieval and reranking run
+            prefix_future = self._prompt_executor.submit(self.llm.build_prefix, self._history_tail())
+            # Callers that already fetched sources (get_relevant_sources) pass
+            # them in to skip a second retrieval; an empty list (failed or
+            # uninitialized lookup) falls back to retrieving here
+            if context:
+                relevant_docs = context[:top_k]
             else:
-                relevant_docs = relevant_docs[:top_k]
+                relevant_docs = self._retrieve(user_message, top_k)
 
             # Prepare context with both content and metadata - FIXED
             context = []
@@ -157,7 +314,7 @@ class RAGChatbot:
                     prompt=user_message,
                     context=context,
                     chat_history=self.chat_history,
-                    conversation_context=conversation_context
+                    prefix=prefix_future.result()
             ):
                 full_response += chunk
                 yield chunk
@@ -168,6 +325,11 @@ class RAGChatbot:
             logger.error(f"Error in streaming chat: {str(e)}")
             yield f"Error: {str(e)}"
 
+    def _history_tail(self):
+        # Snapshot on the caller's thread: chat_history is shared across
+        # sessions and may be appended to while the prefix is being built
+        return tuple(self.chat_history)[-PROMPT_HISTORY_TURNS:]
+
     def _update_chat_history(self, user_message, assistant_response, relevant_docs):
         exchange = {
             'timestamp': datetime.now().isoformat(),
@@ -176,16 +338,14 @@ class RAGChatbot:
             'sources': [doc.get('metadata', {}) for doc in relevant_docs]
         }
 
+        # deque(maxlen=...) drops the oldest exchange in O(1)
         self.chat_history.append(exchange)
 
-        if len(self.chat_history) > MAX_CHAT_HISTORY:
-            self.chat_history = self.chat_history[-MAX_CHAT_HISTORY:]
-
     def clear_chat_history(self):
-        self.chat_history = []
+        self.chat_history.clear()
         logger.info("Chat history cleared")
 
-    def save_chat_history(self, filename=None):
+    def save_chat_history(self, filename=None, indent=False):
         try:
             if not filename:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -193,8 +353,10 @@ class RAGChatbot:
 
             filepath = Path(CHAT_HISTORY_DIR) / filename
 
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(self.chat_history, f, indent=2, ensure_ascii=False)
+            option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            filepath.write_bytes(orjson.dumps(list(self.chat_history), option=option))
 
             logger.info(f"Chat history saved to: {filepath}")
             return str(filepath)
@@ -205,8 +367,10 @@ class RAGChatbot:
 
     def load_chat_history(self, filepath):
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                self.chat_history = json.load(f)
+            self.chat_history = deque(
+                orjson.loads(Path(filepath).read_bytes()),
+                maxlen=MAX_CHAT_HISTORY
+            )
 
             logger.info(f"Chat history loaded from: {filepath}")
             return True
@@ -227,18 +391,20 @@ class RAGChatbot:
 
     def clear_database(self):
         self.retriever.clear_collection()
+        self._clear_query_cache()
         self.is_initialized = False
         logger.info("Database cleared")
 
+    def close(self):
+        self._prompt_executor.shutdown(wait=False)
+        self.llm.close()
+
     def get_relevant_sources(self, user_message, top_k=5):
         try:
             if not self.is_initialized:
                 return []
 
-            query_embedding = self.embedding_manager.embed_text(user_message)
-            relevant_docs = self.retriever.search(query_embedding, top_k=top_k)
-
-            return relevant_docs
+            return self._retrieve(user_message, top_k)
 
         except Exception as e:
             logger.error(f"Error getting relevant sources: {str(e)}")
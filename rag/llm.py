@@ -1,59 +1,241 @@
 # llm.py
+import functools
+import gzip
+import hashlib
+import io
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import time
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
 import logging
-from config import OLLAMA_BASE_URL, DEFAULT_MODEL, TEMPERATURE
+from config import OLLAMA_BASE_URL, DEFAULT_MODEL, TEMPERATURE, OLLAMA_KEEP_ALIVE
+from config import OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT, OLLAMA_MAX_PARALLEL
+from config import MODELS_CACHE_TTL, OLLAMA_GZIP_REQUESTS
+from config import ENABLE_RESPONSE_CACHE, RESPONSE_CACHE_SIZE
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = """You're a helpful research assistant who answers questions based on provided research documents. 
+        Follow these guidelines STRICTLY:
+
+1. Provide detailed, coherent answers in natural paragraphs.
+2. ALWAYS include specific citations in the format: [Document: filename, Page: X]
+3. If the context includes section headings, chapter numbers, or reference information, cite those as well (e.g., [Document: filename, Page: X, Section: Y] or [Document: filename, Chapter: Z, Page: X]).
+4. If the information comes from a reference section, cite it as such (e.g., [Document: filename, Page: X, Reference: ...]).
+5. If the document doesn't contain relevant information, state that clearly.
+6. Maintain a professional, clear style.
+7. Only answer based on the provided documents.
+
+EXAMPLE CITATIONS:
+- [Document: research.pdf, Page: 5]
+- [Document: manual.pdf, Pages: 12, 15]
+- [Document: rep.pdf, Page: 3, Section: Introduction]
+- [Document: paper.pdf, Page: 6, Section: 1.2]
+- [Document: experiment.pdf, Page: 1, Section: A]
+- [Document: predict.pdf, Page: 4, Section: II]
+"""
+
+# Rough chars-per-token estimate; tells Ollama how many prompt tokens to keep
+# when it has to shift the context window.
+SYSTEM_PROMPT_TOKENS = len(SYSTEM_PROMPT) // 4
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+GZIP_JSON_HEADERS = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+SEPARATOR = "=" * 50
+HISTORY_HEADER = "\n\nPrevious Conversation:"
+HISTORY_FOOTER = "\n\n" + SEPARATOR
+CONTEXT_HEADER = "\n\n=== CONTEXT DOCUMENTS ==="
+CONTEXT_FOOTER = "\n" + SEPARATOR
+DOCUMENT_HEADER = "\n\n--- Document {index}{source} ---\n"
+SOURCE_INFO = " [Document: {filename}, Page: {page_number}]"
+ANSWER_INSTRUCTION = "\n\nAnswer based on the context provided above, with accurate citations:"
+MAX_CONTEXT_CHARS = 1000
+PROMPT_HISTORY_TURNS = 3
+
+
+@functools.lru_cache(maxsize=64)
+def _format_history(exchanges):
+    buf = io.StringIO()
+    buf.write(HISTORY_HEADER)
+    for human, assistant in exchanges:
+        buf.write(f"\n\nHuman: {human}\nAssistant: {assistant}")
+    buf.write(HISTORY_FOOTER)
+    return buf.getvalue()
+
+
+def _context_entry(ctx_item):
+    if isinstance(ctx_item, dict):
+        metadata = ctx_item.get('metadata', {})
+        # Chunks ingested by RAGChatbot carry a precomputed header
+        source = metadata.get('prompt_header') or format_source_info(metadata)
+        return ctx_item['content'], source
+    return ctx_item, ""
+
+
+@functools.lru_cache(maxsize=8)
+def _format_context(entries):
+    buf = io.StringIO()
+    buf.write(CONTEXT_HEADER)
+    for i, (content, source) in enumerate(entries, 1):
+        buf.write(DOCUMENT_HEADER.format(index=i, source=source))
+        # Truncate long content to avoid overwhelming the prompt
+        buf.write(content[:MAX_CONTEXT_CHARS])
+        if len(content) > MAX_CONTEXT_CHARS:
+            buf.write("...")
+    buf.write(CONTEXT_FOOTER)
+    return buf.getvalue()
+
+
+def format_source_info(metadata):
+    return SOURCE_INFO.format(
+        filename=metadata.get('filename', 'Unknown'),
+        page_number=metadata.get('page_number', 'N/A')
+    )
+
 
 class OllamaLLM:
-    def __init__(self, base_url=OLLAMA_BASE_URL, model=DEFAULT_MODEL):
-        self.base_url = base_url
-        self.model = model
-        self.temperature = TEMPERATURE
+    def __init__(self, base_url=None, model=None, temperature=None):
+        self.base_url = base_url or OLLAMA_BASE_URL
+        self.model = model or DEFAULT_MODEL
+        self.temperature = TEMPERATURE if temperature is None else temperature
+        # Fail fast when Ollama is down, but allow long generations
+        self.timeout = (OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+        self._session = self._create_session()
+        self._models_cache = None
+        self._models_cache_ts = 0.0
+        self._gzip_requests = False
+        self._response_cache = OrderedDict()
+        self._response_cache_lock = threading.Lock()
         self._check_connection()
 
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=2, backoff_factor=0.1)
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({
+            "Connection": "keep-alive",
+            "Accept-Encoding": "gzip, deflate"
+        })
+        return session
+
+    def close(self):
+        self._session.close()
+
     def _check_connection(self):
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = self._session.get(f"{self.base_url}/api/tags", timeout=OLLAMA_CONNECT_TIMEOUT)
             if response.status_code == 200:
                 logger.info("Connected to Ollama server successfully")
-                models = response.json().get('models', [])
+                models = orjson.loads(response.content).get('models', [])
                 model_names = [model['name'] for model in models]
+                self._cache_models(model_names)
                 if not any(self.model in name for name in model_names):
                     logger.warning(f"Model {self.model} not found. Available models: {model_names}")
+                if OLLAMA_GZIP_REQUESTS:
+                    self._gzip_requests = self._probe_gzip()
             else:
                 logger.error(f"Failed to connect to Ollama server: {response.status_code}")
         except requests.exceptions.RequestException as e:
             logger.error(f"Cannot connect to Ollama server at {self.base_url}: {str(e)}")
             logger.info("Please ensure Ollama is running: 'ollama serve'")
 
-    def generate_response(self, prompt, context=None, chat_history=None):
+    def _probe_gzip(self):
+        # Stock Ollama does not decode gzip request bodies; only a reverse
+        # proxy in front of it might. Check once with a cheap /api/show call.
+        try:
+            response = self._session.post(
+                f"{self.base_url}/api/show",
+                data=gzip.compress(orjson.dumps({"model": self.model}), compresslevel=1),
+                headers=GZIP_JSON_HEADERS,
+                timeout=OLLAMA_CONNECT_TIMEOUT
+            )
+            supported = response.status_code == 200
+        except requests.exceptions.RequestException:
+            supported = False
+
+        if not supported:
+            logger.info("Ollama endpoint does not accept gzip request bodies; sending plain JSON")
+        return supported
+
+    def _post_json(self, path, data, **kwargs):
+        url = f"{self.base_url}{path}"
+        body = orjson.dumps(data)
+        if not self._gzip_requests:
+            return self._session.post(url, data=body, headers=JSON_HEADERS, **kwargs)
+
+        return self._session.post(
+            url,
+            data=gzip.compress(body, compresslevel=1),
+            headers=GZIP_JSON_HEADERS,
+            **kwargs
+        )
+
+    def _response_cache_key(self, full_prompt):
+        key = f"{self.model}\0{self.temperature}\0{full_prompt}"
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+    @property
+    def _response_cache_enabled(self):
+        # Only deterministic (temperature 0) answers are replayed; a sampled
+        # answer must not be served forever for the same prompt
+        return ENABLE_RESPONSE_CACHE and self.temperature == 0
+
+    def _get_cached_response(self, cache_key):
+        if not self._response_cache_enabled:
+            return None
+        with self._response_cache_lock:
+            response = self._response_cache.get(cache_key)
+            if response is not None:
+                self._response_cache.move_to_end(cache_key)
+            return response
+
+    def _cache_response(self, cache_key, response):
+        if not self._response_cache_enabled or not response:
+            return
+        with self._response_cache_lock:
+            self._response_cache[cache_key] = response
+            self._response_cache.move_to_end(cache_key)
+            if len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+
+    def generate_response(self, prompt, context=None, chat_history=None, prefix=None):
         try:
-            full_prompt = self._build_prompt(prompt, context, chat_history)
+            full_prompt = self._build_prompt(prompt, context, chat_history, prefix)
+            cache_key = self._response_cache_key(full_prompt)
+            cached = self._get_cached_response(cache_key)
+            if cached is not None:
+                return cached
 
             data = {
                 "model": self.model,
                 "prompt": full_prompt,
                 "stream": False,
+                "keep_alive": OLLAMA_KEEP_ALIVE,
                 "options": {
                     "temperature": self.temperature,
                     "top_p": 0.9,
-                    "top_k": 40
+                    "top_k": 40,
+                    "num_keep": SYSTEM_PROMPT_TOKENS
                 }
             }
 
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json=data,
-                timeout=3600
-            )
+            response = self._post_json("/api/generate", data, timeout=self.timeout)
 
             if response.status_code == 200:
-                result = response.json()
-                return result.get('response', '').strip()
+                result = orjson.loads(response.content).get('response', '').strip()
+                self._cache_response(cache_key, result)
+                return result
             else:
                 logger.error(f"Ollama API error: {response.status_code} - {response.text}")
                 return "Sorry, I encountered an error while generating a response."
@@ -65,122 +247,119 @@ class OllamaLLM:
             logger.error(f"Error generating response: {str(e)}")
             return "Sorry, I encountered an error while processing your request."
 
-    def _build_prompt(self, user_query, context=None, chat_history=None, conversation_context=None):
-        prompt_parts = []
+    def generate_many(self, prompts, context=None, chat_history=None, max_workers=OLLAMA_MAX_PARALLEL):
+        # Requests share the pooled session; Ollama handles up to
+        # OLLAMA_NUM_PARALLEL of them at once on the server side.
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(
+                lambda prompt: self.generate_response(prompt, context, chat_history),
+                prompts
+            ))
 
-        # Enhanced system message with citation instructions
-        prompt_parts.append("""You're a helpful research assistant who answers questions based on provided research documents. 
-        Follow these guidelines STRICTLY:
+    def build_prefix(self, chat_history=None):
+        # Static system prompt first, then the slowly-changing chat history,
+        # then per-turn context so Ollama can reuse the cached prompt prefix.
+        if not chat_history:
+            return SYSTEM_PROMPT
 
-1. Provide detailed, coherent answers in natural paragraphs.
-2. ALWAYS include specific citations in the format: [Document: filename, Page: X]
-3. If the context includes section headings, chapter numbers, or reference information, cite those as well (e.g., [Document: filename, Page: X, Section: Y] or [Document: filename, Chapter: Z, Page: X]).
-4. If the information comes from a reference section, cite it as such (e.g., [Document: filename, Page: X, Reference: ...]).
-5. If the document doesn't contain relevant information, state that clearly.
-6. Maintain a professional, clear style.
-7. Only answer based on the provided documents.
+        # chat_history is any sized iterable, typically RAGChatbot's bounded
+        # deque; islice walks the tail without copying it into a list.
+        start = max(len(chat_history) - PROMPT_HISTORY_TURNS, 0)
+        exchanges = tuple(
+            (exchange.get('human', ''), exchange.get('assistant', ''))
+            for exchange in itertools.islice(chat_history, start, None)
+        )
+        return SYSTEM_PROMPT + _format_history(exchanges)
 
-EXAMPLE CITATIONS:
-- [Document: research.pdf, Page: 5]
-- [Document: manual.pdf, Pages: 12, 15]
-- [Document: rep.pdf, Page: 3, Section: Introduction]
-- [Document: paper.pdf, Page: 6, Section: 1.2]
-- [Document: experiment.pdf, Page: 1, Section: A]
-- [Document: predict.pdf, Page: 4, Section: II]
-""")
-
-        if conversation_context:
-            prompt_parts.append("\n=== CONVERSATION CONTEXT ===")
-            prompt_parts.append(conversation_context)
-            prompt_parts.append("=" * 50)
-
-        if context:
-            prompt_parts.append("\n=== CONTEXT DOCUMENTS ===")
-            for i, ctx_item in enumerate(context, 1):
-                if isinstance(ctx_item, dict):
-                    content = ctx_item['content']
-                    metadata = ctx_item.get('metadata', {})
-                    filename = metadata.get('filename', 'Unknown')
-                    page_number = metadata.get('page_number', 'N/A')
-                    source_info = f" [Document: {filename}, Page: {page_number}]"
-                else:
-                    content = ctx_item
-                    source_info = ""
-                
-                prompt_parts.append(f"\n--- Document {i}{source_info} ---")
-                # Truncate long content to avoid overwhelming the prompt
-                if len(content) > 1000:
-                    content = content[:1000] + "..."
-                prompt_parts.append(content)
-            prompt_parts.append("=" * 50)
-
-        if chat_history:
-            prompt_parts.append("\nPrevious Conversation:")
-            for exchange in chat_history[-3:]:  
-                prompt_parts.append(f"\nHuman: {exchange.get('human', '')}")
-                prompt_parts.append(f"Assistant: {exchange.get('assistant', '')}")
-            prompt_parts.append("\n" + "=" * 50)
-
-        prompt_parts.append(f"\nCurrent Question: {user_query}")
-        prompt_parts.append("\nAnswer based on the context provided above, with accurate citations:")
-
-        return "\n".join(prompt_parts)
-
-    def stream_response(self, prompt, context=None, chat_history=None, conversation_context=None):
+    def _build_prompt(self, user_query, context=None, chat_history=None, prefix=None):
+        if prefix is None:
+            prefix = self.build_prefix(chat_history)
+
+        # Only the question changes between turns that reuse the same
+        # retrieved context, so the rendered context block is memoized.
+        context_block = _format_context(tuple(map(_context_entry, context))) if context else ""
+
+        return f"{prefix}{context_block}\n\nCurrent Question: {user_query}{ANSWER_INSTRUCTION}"
+
+    def stream_response(self, prompt, context=None, chat_history=None, prefix=None):
         try:
-            full_prompt = self._build_prompt(prompt, context, chat_history, conversation_context)
+            full_prompt = self._build_prompt(prompt, context, chat_history, prefix)
+            cache_key = self._response_cache_key(full_prompt)
+            cached = self._get_cached_response(cache_key)
+            if cached is not None:
+                yield cached
+                return
 
             data = {
                 "model": self.model,
                 "prompt": full_prompt,
                 "stream": True,
+                "keep_alive": OLLAMA_KEEP_ALIVE,
                 "options": {
                     "temperature": self.temperature,
                     "top_p": 0.9,
-                    "top_k": 40
+                    "top_k": 40,
+                    "num_keep": SYSTEM_PROMPT_TOKENS
                 }
             }
 
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json=data,
+            # Closing the response hands the connection back to the pool
+            with self._post_json(
+                "/api/generate",
+                data,
                 stream=True,
-                timeout=3600
-            )
-
-            if response.status_code == 200:
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            chunk = json.loads(line.decode('utf-8'))
-                            if 'response' in chunk:
-                                yield chunk['response']
-                            if chunk.get('done', False):
-                                break
-                        except json.JSONDecodeError:
-                            continue
-            else:
-                yield "Error: Failed to get response from Ollama"
+                timeout=self.timeout
+            ) as response:
+                if response.status_code == 200:
+                    parts = []
+                    for line in response.iter_lines():
+                        if line:
+                            try:
+                                chunk = orjson.loads(line)
+                                if 'response' in chunk:
+                                    parts.append(chunk['response'])
+                                    yield chunk['response']
+                                if chunk.get('done', False):
+                                    # Only complete generations are cached
+                                    self._cache_response(cache_key, "".join(parts))
+                                    break
+                            except orjson.JSONDecodeError:
+                                continue
+                else:
+                    yield "Error: Failed to get response from Ollama"
 
         except Exception as e:
             logger.error(f"Error in streaming response: {str(e)}")
             yield f"Error: {str(e)}"
 
-    # def get_available_models(self):
-    #     try:
-    #         response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-    #         if response.status_code == 200:
-    #             models = response.json().get('models', [])
-    #             return [model['name'] for model in models]
-    #         return []
-    #     except Exception as e:
-    #         logger.error(f"Error getting available models: {str(e)}")
-    #         return []
-
-    # def set_model(self, model_name):
-    #     available_models = self.get_available_models()
-    #     if any(model_name in name for name in available_models):
-    #         self.model = model_name
-    #         logger.info(f"Model changed to: {model_name}")
-    #     else:
-    #         logger.error(f"Model {model_name} not available. Available models: {available_models}")
\ No newline at end of file
+    def get_available_models(self):
+        if (self._models_cache is not None
+                and time.monotonic() - self._models_cache_ts < MODELS_CACHE_TTL):
+            return self._models_cache
+
+        try:
+            response = self._session.get(f"{self.base_url}/api/tags", timeout=OLLAMA_CONNECT_TIMEOUT)
+            if response.status_code == 200:
+                models = orjson.loads(response.content).get('models', [])
+                self._cache_models([model['name'] for model in models])
+                return self._models_cache
+            self._models_cache = None
+            return []
+        except Exception as e:
+            logger.error(f"Error getting available models: {str(e)}")
+            self._models_cache = None
+            return []
+
+    def _cache_models(self, model_names):
+        self._models_cache = model_names
+        self._models_cache_ts = time.monotonic()
+
+    def set_model(self, model_name):
+        available_models = self.get_available_models()
+        if any(model_name in name for name in available_models):
+            self.model = model_name
+            # Force a fresh listing next time, e.g. after a pull
+            self._models_cache = None
+            logger.info(f"Model changed to: {model_name}")
+        else:
+            logger.error(f"Model {model_name} not available. Available models: {available_models}")
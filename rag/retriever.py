@@ -2,36 +2,217 @@
 import chromadb
 from chromadb.config import Settings
 from typing import List, Dict, Any, Optional, Tuple
+import copy
+import hashlib
 import logging
+import itertools
+import os
 import re
-from config import PERSIST_DIRECTORY, ENABLE_HYBRID_SEARCH, HYBRID_ALPHA
+import shutil
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+from config import PERSIST_DIRECTORY, ENABLE_HYBRID_SEARCH, HYBRID_ALPHA, CHROMA_ADD_BATCH_SIZE
+from config import RRF_K, HYBRID_CANDIDATE_MARGIN, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+TOKEN_PATTERN = re.compile(r'\b[a-zA-Z]{3,}\b')
+STOP_WORDS = frozenset({'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for'})
+KEYWORD_INDEX_PAGE_SIZE = 1000
+# Embeddings are L2-normalized, so inner product ranks like cosine without
+# the per-pair norms. Only applies to newly created collections.
+COLLECTION_METADATA = {"hnsw:space": "ip"}
+
+# One PersistentClient per persist directory, shared by every retriever.
+# Collections are independent, but client-level calls (reset, settings) are not
+# safe to make concurrently from different retrievers.
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _get_client(persist_directory):
+    key = str(Path(persist_directory).resolve())
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = chromadb.PersistentClient(path=str(persist_directory))
+            _CLIENTS[key] = client
+        return client
+
+
+class KeywordIndex:
+    # Inverted index: lowercase token -> ids of the chunks containing it.
+    # A saved index is memory-mapped as CSR arrays (the "base"); chunks added
+    # afterwards live in in-memory postings until the next save.
+    ARRAY_NAMES = ('tokens', 'offsets', 'postings', 'ids')
+
+    def __init__(self):
+        self._postings = defaultdict(set)
+        # id -> tokens for chunks added since the last save
+        self._added_tokens = {}
+        self._base = None
+        self._base_vocab = {}
+        self._base_id_positions = {}
+        # Guards the postings and the base swap; _save_lock keeps saves ordered
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+
+    @property
+    def doc_count(self):
+        with self._lock:
+            base_count = len(self._base['ids']) if self._base is not None else 0
+            return base_count + len(self._added_tokens)
+
+    def add(self, ids, texts):
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                # Chroma keeps the first copy of a duplicate id; so does the index
+                if doc_id in self._added_tokens or doc_id in self._base_id_positions:
+                    continue
+                tokens = set(TOKEN_PATTERN.findall(text.lower()))
+                self._added_tokens[doc_id] = tokens
+                for token in tokens:
+                    self._postings[token].add(doc_id)
+
+    def _base_positions(self, token):
+        row = self._base_vocab.get(token)
+        if row is None:
+            return self._base['postings'][:0] if self._base is not None else []
+        start, end = self._base['offsets'][row], self._base['offsets'][row + 1]
+        return self._base['postings'][start:end]
+
+    def postings(self, token):
+        with self._lock:
+            doc_ids = []
+            if self._base is not None:
+                doc_ids = self._base['ids'][self._base_positions(token)].tolist()
+            added = self._postings.get(token)
+            if added:
+                doc_ids.extend(added)
+            return doc_ids
+
+    def search(self, keywords, top_k):
+        # Score = number of distinct query keywords the chunk contains
+        scores = Counter()
+        with self._lock:
+            for keyword in set(keywords):
+                scores.update(self.postings(keyword))
+        # most_common(n) selects with heapq.nlargest rather than a full sort
+        return [doc_id for doc_id, _ in scores.most_common(top_k)]
+
+    def save(self, directory):
+        with self._save_lock:
+            with self._lock:
+                if self._base is not None and not self._added_tokens:
+                    return
+                arrays = self._build_arrays()
+                saved_ids = list(self._added_tokens)
+
+            # Written to temp files without the lock; searches keep using the
+            # current base and in-memory postings meanwhile
+            directory = Path(directory)
+            directory.mkdir(parents=True, exist_ok=True)
+            for name, array in arrays.items():
+                with open(directory / f"{name}.npy.tmp", 'wb') as f:
+                    np.save(f, array)
+
+            with self._lock:
+                # Release the old memory maps before their files are replaced
+                self._base = None
+                for name in self.ARRAY_NAMES:
+                    os.replace(directory / f"{name}.npy.tmp", directory / f"{name}.npy")
+                self._load_base(directory)
+                # Chunks added while writing stay in memory for the next save
+                for doc_id in saved_ids:
+                    for token in self._added_tokens.pop(doc_id):
+                        doc_ids = self._postings[token]
+                        doc_ids.discard(doc_id)
+                        if not doc_ids:
+                            del self._postings[token]
+
+    def _build_arrays(self):
+        # Base ids keep their positions, so base postings are copied as-is
+        ids = self._base['ids'].tolist() if self._base is not None else []
+        id_positions = dict(self._base_id_positions)
+        for doc_id in self._added_tokens:
+            if doc_id not in id_positions:
+                id_positions[doc_id] = len(ids)
+                ids.append(doc_id)
+
+        tokens = sorted(set(self._base_vocab) | set(self._postings))
+        offsets = [0]
+        postings = []
+        for token in tokens:
+            positions = np.asarray(self._base_positions(token)).tolist()
+            positions.extend(id_positions[doc_id] for doc_id in self._postings.get(token, ()))
+            # Dedupe so indexes saved with repeated postings heal on the next save
+            postings.extend(sorted(set(positions)))
+            offsets.append(len(postings))
+
+        return {
+            'tokens': np.array(tokens, dtype=str),
+            'offsets': np.array(offsets, dtype=np.int64),
+            'postings': np.array(postings, dtype=np.int32),
+            'ids': np.array(ids, dtype=str)
+        }
+
+    def _load_base(self, directory):
+        self._base = {
+            name: np.load(Path(directory) / f"{name}.npy", mmap_mode='r')
+            for name in self.ARRAY_NAMES
+        }
+        self._base_vocab = {token: row for row, token in enumerate(self._base['tokens'].tolist())}
+        self._base_id_positions = {doc_id: i for i, doc_id in enumerate(self._base['ids'].tolist())}
+
+    @classmethod
+    def load(cls, directory):
+        directory = Path(directory)
+        if not all((directory / f"{name}.npy").exists() for name in cls.ARRAY_NAMES):
+            return None
+        index = cls()
+        index._load_base(directory)
+        return index
+
+
 class VectorRetriever:
     def __init__(self, persist_directory=PERSIST_DIRECTORY,
-                 collection_name=None):
+                 collection_name=None, add_batch_size=CHROMA_ADD_BATCH_SIZE):
         self.persist_directory = persist_directory
         self.collection_name = collection_name
         self.client = None
         self.collection = None
+        self._keyword_index = None
+        # Rewriting the keyword index is O(corpus); it runs off the request path
+        self._index_saver = ThreadPoolExecutor(max_workers=1)
+        self._search_cache = OrderedDict()
+        self._cache_lock = threading.RLock()
+        self._cache_generation = 0
         self._initialize_db()
+        self.add_batch_size = self._clamp_batch_size(add_batch_size)
+
+    def _clamp_batch_size(self, batch_size):
+        try:
+            max_batch_size = self.client.get_max_batch_size()
+        except Exception:
+            max_batch_size = batch_size
+        return max(1, min(batch_size, max_batch_size))
 
     def _initialize_db(self):
         try:
-            self.client = chromadb.PersistentClient(path=self.persist_directory)
+            self.client = _get_client(self.persist_directory)
 
             if self.collection_name is None:
                 from config import generate_collection_name
                 self.collection_name = generate_collection_name()
 
-            try:
-                self.collection = self.client.get_collection(name=self.collection_name)
-                logger.info(f"Loaded existing collection: {self.collection_name}")
-            except:
-                self.collection = self.client.create_collection(name=self.collection_name)
-                logger.info(f"Created new collection: {self.collection_name}")
+            self.collection = self.client.get_or_create_collection(
+                name=self.collection_name, metadata=COLLECTION_METADATA
+            )
+            logger.info("Using collection: %s", self.collection_name)
 
         except Exception as e:
             logger.error(f"Failed to initialize ChromaDB: {str(e)}")
@@ -43,49 +224,149 @@ class VectorRetriever:
             return
 
         try:
-            ids = []
-            embeddings = []
-            metadatas = []
-            documents_text = []
-
-            for i, doc in enumerate(documents):
-                doc_id = f"{doc['metadata'].get('filename', 'unknown')}_{doc['metadata'].get('global_chunk_id', i)}"
-                ids.append(doc_id)
-                embeddings.append(doc['embedding'])
-                
-                metadata = {}
-                for key, value in doc['metadata'].items():
-                    if key == 'page_number' and value is not None:
-                        metadata[key] = str(value)
-                    else:
-                        metadata[key] = str(value) if value is not None else ''
-                metadatas.append(metadata)
-                documents_text.append(doc['content'])
-
-            self.collection.add(
-                ids=ids,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                documents=documents_text
-            )
-
-            logger.info(f"Added {len(documents)} documents to collection: {self.collection_name}")
+            rows = [self._prepare_row(i, doc) for i, doc in enumerate(documents)]
+            ids, embeddings, metadatas, documents_text = map(list, zip(*rows))
+
+            # One contiguous float32 matrix, inserted in bounded slices to cap
+            # peak memory and stay under Chroma's max batch size.
+            embedding_matrix = np.asarray(embeddings, dtype=np.float32)
+            norms = np.linalg.norm(embedding_matrix, axis=1, keepdims=True)
+            embedding_matrix /= np.maximum(norms, 1e-12)
+            for start in range(0, len(ids), self.add_batch_size):
+                end = start + self.add_batch_size
+                self.collection.add(
+                    ids=ids[start:end],
+                    embeddings=embedding_matrix[start:end],
+                    metadatas=metadatas[start:end],
+                    documents=documents_text[start:end]
+                )
+
+            if self._keyword_index is not None:
+                self._keyword_index.add(ids, documents_text)
+                self._index_saver.submit(self._save_keyword_index, self._keyword_index)
+            self._invalidate_search_cache()
+
+            logger.info("Added %d documents to collection: %s", len(documents), self.collection_name)
 
         except Exception as e:
             logger.error(f"Error adding documents to vector database: {str(e)}")
             raise
 
+    def distance_to_similarity(self, distance):
+        # Collections created before COLLECTION_METADATA keep Chroma's l2
+        # default; for unit vectors squared L2 is 2 - 2*cos, ip/cosine is 1 - cos
+        if distance is None:
+            return None
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "l2":
+            return 1 - distance / 2
+        return 1 - distance
+
+    @staticmethod
+    def _prepare_row(i, doc):
+        metadata = doc['metadata']
+        doc_id = f"{metadata.get('filename', 'unknown')}_{metadata.get('global_chunk_id', i)}"
+        # Chroma metadata values must be scalars; store everything as strings
+        metadata_str = {
+            key: value if isinstance(value, str) else ('' if value is None else str(value))
+            for key, value in metadata.items()
+        }
+        return doc_id, doc['embedding'], metadata_str, doc['content']
+
     def search(self, query_embedding, query_text=None, top_k=5, use_hybrid=True):
         try:
-            if use_hybrid and query_text and ENABLE_HYBRID_SEARCH:
-                return self._hybrid_search(query_embedding, query_text, top_k)
+            hybrid = bool(use_hybrid and query_text and ENABLE_HYBRID_SEARCH)
+            cache_key = self._search_cache_key(query_embedding, query_text if hybrid else None, top_k)
+            cached = self._get_cached_search(cache_key)
+            if cached is not None:
+                return cached
+
+            if hybrid:
+                results = self._hybrid_search(query_embedding, query_text, top_k)
             else:
-                return self._semantic_search(query_embedding, top_k)
+                results = self._semantic_search(query_embedding, top_k)
+
+            self._cache_search(cache_key, results)
+            return results
 
         except Exception as e:
             logger.error(f"Error searching vector database: {str(e)}")
             return []
 
+    def batch_search(self, query_embeddings, top_k=5):
+        try:
+            query_matrix = np.asarray(query_embeddings, dtype=np.float32)
+            if query_matrix.ndim == 1:
+                query_matrix = query_matrix[np.newaxis, :]
+
+            batch_results = [None] * len(query_matrix)
+            cache_keys = [self._search_cache_key(row, None, top_k) for row in query_matrix]
+            misses = []
+            for i, cache_key in enumerate(cache_keys):
+                batch_results[i] = self._get_cached_search(cache_key)
+                if batch_results[i] is None:
+                    misses.append(i)
+
+            if misses:
+                # Chroma vectorizes across queries, so all misses go in one call
+                results = self.collection.query(
+                    query_embeddings=query_matrix[misses],
+                    n_results=top_k
+                )
+                for row, i in enumerate(misses):
+                    batch_results[i] = self._format_search_results(
+                        self._query_row(results, row)
+                    )
+                    self._cache_search(cache_keys[i], batch_results[i])
+
+            return batch_results
+
+        except Exception as e:
+            logger.error(f"Error batch searching vector database: {str(e)}")
+            return [[] for _ in range(len(query_embeddings))]
+
+    @staticmethod
+    def _query_row(results, row):
+        return {
+            key: [results[key][row]] if results.get(key) else None
+            for key in ('documents', 'metadatas', 'distances')
+        }
+
+    def _search_cache_key(self, query_embedding, query_text, top_k):
+        digest = hashlib.blake2b(
+            np.asarray(query_embedding, dtype=np.float32).tobytes(), digest_size=16
+        ).digest()
+        # The generation changes whenever the collection does
+        return digest, query_text, top_k, self._cache_generation
+
+    def _get_cached_search(self, cache_key):
+        if not SEARCH_CACHE_SIZE:
+            return None
+        with self._cache_lock:
+            entry = self._search_cache.get(cache_key)
+            if entry is None:
+                return None
+            stored_at, results = entry
+            if time.monotonic() - stored_at > SEARCH_CACHE_TTL:
+                del self._search_cache[cache_key]
+                return None
+            self._search_cache.move_to_end(cache_key)
+            return copy.deepcopy(results)
+
+    def _cache_search(self, cache_key, results):
+        if not SEARCH_CACHE_SIZE:
+            return
+        with self._cache_lock:
+            self._search_cache[cache_key] = (time.monotonic(), copy.deepcopy(results))
+            self._search_cache.move_to_end(cache_key)
+            while len(self._search_cache) > SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+
+    def _invalidate_search_cache(self):
+        with self._cache_lock:
+            self._cache_generation += 1
+            self._search_cache.clear()
+
     def _semantic_search(self, query_embedding, top_k):
         results = self.collection.query(
             query_embeddings=[query_embedding],
@@ -98,11 +379,11 @@ class VectorRetriever:
         # Semantic search
         semantic_results = self.collection.query(
             query_embeddings=[query_embedding],
-            n_results=top_k * 2  # Lấy nhiều kết quả hơn để kết hợp
+            n_results=top_k + HYBRID_CANDIDATE_MARGIN  # Lấy nhiều kết quả hơn để kết hợp
         )
 
         # Keyword search
-        keyword_results = self._keyword_search(query_text, top_k * 2)
+        keyword_results = self._keyword_search(query_text, top_k + HYBRID_CANDIDATE_MARGIN)
 
         # Kết hợp kết quả
         combined_results = self._combine_results(
@@ -111,113 +392,156 @@ class VectorRetriever:
 
         return combined_results
 
-    def _keyword_search(self, query_text, top_k):
+    def _keyword_index_dir(self):
+        return Path(self.persist_directory) / "keyword_index" / self.collection_name
+
+    def _get_keyword_index(self):
+        # Loaded from disk (or rebuilt from the collection) on first use, then
+        # kept in sync by add_documents
+        if self._keyword_index is None:
+            index = None
+            try:
+                index = KeywordIndex.load(self._keyword_index_dir())
+            except Exception as e:
+                logger.warning(f"Could not load keyword index: {str(e)}")
+
+            if index is not None and index.doc_count != self.collection.count():
+                logger.info("Keyword index is out of date, rebuilding")
+                index = None
+
+            if index is None:
+                index = self._build_keyword_index()
+                self._save_keyword_index(index)
+            self._keyword_index = index
+        return self._keyword_index
+
+    def _build_keyword_index(self):
+        index = KeywordIndex()
+        offset = 0
+        while True:
+            page = self.collection.get(
+                include=["documents"],
+                limit=KEYWORD_INDEX_PAGE_SIZE,
+                offset=offset
+            )
+            if not page['ids']:
+                break
+            index.add(page['ids'], page['documents'])
+            offset += len(page['ids'])
+        return index
+
+    def _save_keyword_index(self, index):
         try:
-            all_docs = self.collection.get(limit=1000)  # Adjust limit as needed
-            
-            if not all_docs['documents']:
-                return {'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
+            index.save(self._keyword_index_dir())
+        except Exception as e:
+            logger.warning(f"Could not persist keyword index: {str(e)}")
+
+    def _drop_keyword_index(self):
+        self._keyword_index = None
+        shutil.rmtree(self._keyword_index_dir(), ignore_errors=True)
 
+    def _keyword_search(self, query_text, top_k):
+        empty_results = {'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
+        try:
             keywords = self._extract_keywords(query_text)
             if not keywords:
-                return {'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
-
-            # Tìm documents chứa ít nhất một từ khóa
-            matching_indices = []
-            for i, doc_content in enumerate(all_docs['documents']):
-                doc_lower = doc_content.lower()
-                for keyword in keywords:
-                    if keyword in doc_lower:
-                        matching_indices.append(i)
-                        break  # Chỉ cần khớp một từ khóa
-
-            # Lấy kết quả matching
-            if matching_indices:
-                matching_docs = [all_docs['documents'][i] for i in matching_indices]
-                matching_metadatas = [all_docs['metadatas'][i] for i in matching_indices]
-                
-                # Sắp xếp theo số từ khóa khớp
-                scored_docs = []
-                for doc, metadata in zip(matching_docs, matching_metadatas):
-                    score = sum(1 for keyword in keywords if keyword in doc.lower())
-                    scored_docs.append((score, doc, metadata))
-                
-                scored_docs.sort(key=lambda x: x[0], reverse=True)
-                top_scored = scored_docs[:top_k]
-                
-                documents = [doc for _, doc, _ in top_scored]
-                metadatas = [metadata for _, _, metadata in top_scored]
-                
-                formatted_results = {
-                    'documents': [documents],
-                    'metadatas': [metadatas],
-                    'distances': [[0.0] * len(documents)]
-                }
-            else:
-                formatted_results = {'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
+                return empty_results
+
+            matching_ids = self._get_keyword_index().search(keywords, top_k)
+            if not matching_ids:
+                return empty_results
+
+            matches = self.collection.get(
+                ids=matching_ids,
+                include=["documents", "metadatas"]
+            )
+            # Chroma does not guarantee the order of get(ids=...)
+            position = {doc_id: i for i, doc_id in enumerate(matches['ids'])}
+            order = [position[doc_id] for doc_id in matching_ids if doc_id in position]
 
-            return formatted_results
+            documents = [matches['documents'][i] for i in order]
+            metadatas = [matches['metadatas'][i] for i in order]
+
+            return {
+                'documents': [documents],
+                'metadatas': [metadatas],
+                # Keyword hits have no semantic distance
+                'distances': [[None] * len(documents)]
+            }
 
         except Exception as e:
             logger.error(f"Error in keyword search: {str(e)}")
-            return {'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
+            return empty_results
 
     def _extract_keywords(self, text):
         # Loại bỏ stopwords đơn giản và trích xuất từ khóa
-        stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for'}
-        words = re.findall(r'\b[a-zA-Z]{3,}\b', text.lower())
-        keywords = [word for word in words if word not in stop_words]
+        keywords = [word for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
         return keywords[:5]  # Giới hạn số từ khóa
 
     def _combine_results(self, semantic_results, keyword_results, top_k):
-        semantic_docs = self._format_search_results(semantic_results)
-        keyword_docs = self._format_search_results(keyword_results)
-
-        # Kết hợp và xếp hạng lại
-        all_docs = {}
-        
-        # Thêm semantic results với trọng số
-        for doc in semantic_docs:
-            doc_id = doc['metadata'].get('filename', '') + str(doc['metadata'].get('global_chunk_id', ''))
-            all_docs[doc_id] = {
-                'doc': doc,
-                'score': HYBRID_ALPHA * (1 - (doc.get('distance', 0) if doc.get('distance') else 0))
-            }
+        # Kết hợp và xếp hạng lại bằng weighted Reciprocal Rank Fusion:
+        # score = sum(weight / (RRF_K + rank)), independent of distance scale.
+        slots = {}
+        docs = []
+        scores = np.zeros(
+            len(self._result_documents(semantic_results)) + len(self._result_documents(keyword_results)),
+            dtype=np.float32
+        )
 
-        # Thêm keyword results với trọng số
-        for doc in keyword_docs:
-            doc_id = doc['metadata'].get('filename', '') + str(doc['metadata'].get('global_chunk_id', ''))
-            if doc_id in all_docs:
-                all_docs[doc_id]['score'] += (1 - HYBRID_ALPHA) * 0.8  # Trọng số cho keyword match
-            else:
-                all_docs[doc_id] = {
-                    'doc': doc,
-                    'score': (1 - HYBRID_ALPHA) * 0.8
-                }
+        for weight, results in ((HYBRID_ALPHA, semantic_results), (1 - HYBRID_ALPHA, keyword_results)):
+            for rank, row in enumerate(self._iter_result_rows(results), 1):
+                slot = self._result_slot(row, slots, docs)
+                scores[slot] += weight / (RRF_K + rank)
 
         # Sắp xếp theo điểm và lấy top_k
-        sorted_docs = sorted(all_docs.values(), key=lambda x: x['score'], reverse=True)
-        final_results = [item['doc'] for item in sorted_docs[:top_k]]
-
-        return final_results
+        return [docs[i] for i in self._top_k_indices(scores[:len(docs)], top_k)]
+
+    @staticmethod
+    def _result_slot(row, slots, docs):
+        # Result dicts are only built for chunks not seen yet
+        content, metadata, distance = row
+        doc_id = metadata.get('filename', '') + str(metadata.get('global_chunk_id', ''))
+        slot = slots.get(doc_id)
+        if slot is None:
+            slot = slots[doc_id] = len(docs)
+            docs.append({'content': content, 'metadata': metadata, 'distance': distance})
+        return slot
+
+    @staticmethod
+    def _top_k_indices(scores, top_k):
+        # argpartition selects the top_k in O(n); only those are sorted
+        n = len(scores)
+        if n == 0 or top_k <= 0:
+            return []
+        if top_k < n:
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(n)
+        return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+    @staticmethod
+    def _result_documents(results):
+        return results['documents'][0] if results['documents'] else []
+
+    def _iter_result_rows(self, results):
+        documents = self._result_documents(results)
+        if not documents:
+            return iter(())
+        distances = results['distances'][0] if results['distances'] and results['distances'][0] else None
+        return zip(documents, results['metadatas'][0], distances or itertools.repeat(None))
 
     def _format_search_results(self, results):
-        formatted_results = []
-        if results['documents'] and results['documents'][0]:
-            for i in range(len(results['documents'][0])):
-                result = {
-                    'content': results['documents'][0][i],
-                    'metadata': results['metadatas'][0][i],
-                    'distance': results['distances'][0][i] if results['distances'] and results['distances'][0] else None
-                }
-                formatted_results.append(result)
-
-        return formatted_results
+        return [
+            {'content': content, 'metadata': metadata, 'distance': distance}
+            for content, metadata, distance in self._iter_result_rows(results)
+        ]
 
     # Các phương thức khác giữ nguyên...
     def delete_collection(self):
         try:
             self.client.delete_collection(name=self.collection_name)
+            self._drop_keyword_index()
+            self._invalidate_search_cache()
             logger.info(f"Deleted collection: {self.collection_name}")
         except Exception as e:
             logger.error(f"Error deleting collection: {str(e)}")
@@ -236,9 +560,13 @@ class VectorRetriever:
 
     def clear_collection(self):
         try:
-            results = self.collection.get()
-            if results['ids']:
-                self.collection.delete(ids=results['ids'])
-                logger.info("Cleared all documents from collection")
+            # Dropping and recreating the collection avoids fetching every id
+            self.client.delete_collection(name=self.collection_name)
+            self.collection = self.client.get_or_create_collection(
+                name=self.collection_name, metadata=COLLECTION_METADATA
+            )
+            logger.info("Cleared all documents from collection")
+            self._drop_keyword_index()
+            self._invalidate_search_cache()
         except Exception as e:
             logger.error(f"Error clearing collection: {str(e)}")
\ No newline at end of file
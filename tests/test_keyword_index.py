@@ -0,0 +1,25 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+pytest.importorskip("chromadb")
+
+from rag.retriever import KeywordIndex
+
+
+def test_readding_saved_id_is_not_counted_twice(tmp_path):
+    index = KeywordIndex()
+    index.add(['a', 'b', 'c'], ['retrieval basics', 'dense retrieval', 'sparse vectors'])
+    index.save(tmp_path)
+
+    index.add(['a', 'd'], ['retrieval basics', 'retrieval at scale'])
+    assert index.doc_count == 4
+    assert sorted(index.postings('retrieval')) == ['a', 'b', 'd']
+
+    index.save(tmp_path)
+    reloaded = KeywordIndex.load(tmp_path)
+    assert reloaded.doc_count == 4
+    assert sorted(reloaded.postings('retrieval')) == ['a', 'b', 'd']
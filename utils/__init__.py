@@ -1,5 +1,10 @@
+import logging
+
 from .document_loader import DocumentLoader
 from .text_processor import TextProcessor
-from .embeddings import EmbeddingManager
+from .embeddings import EmbeddingManager, get_embedding_manager
+
+__all__ = ['DocumentLoader', 'TextProcessor', 'EmbeddingManager', 'get_embedding_manager']
 
-__all__ = ['DocumentLoader', 'TextProcessor', 'EmbeddingManager']
\ No newline at end of file
+# Libraries leave handler setup to the application (main.py, streamlit_app.py)
+logging.getLogger(__name__).addHandler(logging.NullHandler())
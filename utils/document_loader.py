@@ -1,24 +1,93 @@
 import os
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
-import fitz  # PyMuPDF
+from typing import List, Dict, Any
 import pymupdf
 import cv2
 import numpy as np
 import pytesseract
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
 from PIL import Image
 import logging
-from config import SUPPORTED_EXTENSIONS
-import io
-import psutil
-import time
+from config import SUPPORTED_EXTENSIONS, DOCUMENT_LOADER_WORKERS, ENABLE_PDF_CACHE, PDF_CACHE_DIR
+from config import PDF_PAGES_PER_TASK, OCR_CACHE_SIZE, PDF_CACHE_MAX_MB
+import bisect
+import hashlib
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import orjson
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump when the extraction output changes so stale cache entries are ignored
+PDF_CACHE_VERSION = 3
+PDF_HASH_CHUNK_BYTES = 1024 * 1024
+# Pages with less extractable text than this are treated as scanned images
+SCANNED_PAGE_MAX_CHARS = 50
+# Blank rows between images stacked for a single OCR pass
+OCR_BATCH_PADDING = 20
+# Tesseract rejects images taller than 32767 px; batches are split well below
+OCR_BATCH_MAX_HEIGHT = 16000
+
+_worker_loader = None
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool():
+    # Shared by file- and page-level fan-out so workers (and their imports)
+    # are started once per process, not once per document
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn rather than fork: the parent already runs torch and chroma threads
+            _process_pool = ProcessPoolExecutor(
+                max_workers=DOCUMENT_LOADER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+
+def _get_worker_loader():
+    # One loader per worker process; DocumentLoader holds the cv2 module and
+    # cannot be pickled, so bound methods are not sent across processes.
+    # Workers never fan out again.
+    global _worker_loader
+    if _worker_loader is None:
+        _worker_loader = DocumentLoader(parallel=False)
+    return _worker_loader
+
+
+def _load_document_in_worker(file_path):
+    return _get_worker_loader().load_document(file_path)
+
+
+def _process_pages_in_worker(file_path, page_numbers):
+    # MuPDF documents cannot be shared across processes; each task opens its own
+    loader = _get_worker_loader()
+    with pymupdf.open(stream=Path(file_path).read_bytes(), filetype="pdf") as doc:
+        return [
+            (page_num, *loader._process_page(doc.load_page(page_num), page_num, file_path))
+            for page_num in page_numbers
+        ]
+
+
 class DocumentLoader:
-    def __init__(self):
+    def __init__(self, parallel=True):
         self.supported_extensions = SUPPORTED_EXTENSIONS
+        self.parallel = parallel and DOCUMENT_LOADER_WORKERS > 1
+        # The loader is shared by every session of the chatbot: tesserocr
+        # handles are not thread-safe, so OCR calls are serialized, and the
+        # edge buffer is per thread
+        self._ocr_apis = {}
+        self._ocr_lock = threading.Lock()
+        self._ocr_cache = OrderedDict()
+        self._ocr_cache_lock = threading.Lock()
+        self._local = threading.local()
         self.table_detector = None
         self._initialize_table_detector()
 
@@ -41,9 +110,14 @@ class DocumentLoader:
             raise ValueError(f"Unsupported file type: {extension}")
 
         try:
+            cache_path = self._cache_path(file_path) if ENABLE_PDF_CACHE else None
+            document = self._load_cached_document(cache_path, file_path)
+            if document is not None:
+                return document
+
             content_data = self._load_enhanced_pdf(file_path)
 
-            return {
+            document = {
                 'content': content_data['formatted_text'],
                 'pages': content_data['pages'],
                 'tables': content_data['tables'],
@@ -58,65 +132,114 @@ class DocumentLoader:
                     'has_images': len(content_data['images']) > 0
                 }
             }
+            self._save_cached_document(cache_path, document)
+            return document
         except Exception as e:
             logger.error(f"Error loading document {file_path}: {str(e)}")
             raise
 
+    @staticmethod
+    def _cache_path(file_path):
+        # Hash of the full content: an edit anywhere in the PDF changes the key,
+        # while the same bytes at another path (re-uploads) still hit
+        digest = hashlib.blake2b(f"{PDF_CACHE_VERSION}:".encode(), digest_size=20)
+        with open(file_path, 'rb') as f:
+            while chunk := f.read(PDF_HASH_CHUNK_BYTES):
+                digest.update(chunk)
+        return Path(PDF_CACHE_DIR) / f"{digest.hexdigest()}.json"
+
+    @staticmethod
+    def _load_cached_document(cache_path, file_path):
+        if cache_path is None or not cache_path.exists():
+            return None
+        try:
+            document = orjson.loads(cache_path.read_bytes())
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable PDF cache entry {cache_path.name}: {str(e)}")
+            return None
+
+        # Touch the entry so eviction drops the least recently used ones
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+
+        # The same bytes may live at another path (e.g. a re-uploaded file)
+        document['metadata']['filename'] = file_path.name
+        document['metadata']['file_path'] = str(file_path)
+        logger.info("Loaded %s from PDF cache", file_path.name)
+        return document
+
+    @staticmethod
+    def _save_cached_document(cache_path, document):
+        if cache_path is None:
+            return
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+            tmp_path.write_bytes(orjson.dumps(document, option=orjson.OPT_SERIALIZE_NUMPY))
+            os.replace(tmp_path, cache_path)
+            DocumentLoader._prune_cache(cache_path.parent)
+        except Exception as e:
+            logger.warning(f"Could not write PDF cache entry: {str(e)}")
+
+    @staticmethod
+    def _prune_cache(cache_dir):
+        entries = []
+        for path in cache_dir.glob('*.json'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        limit = PDF_CACHE_MAX_MB * 1024 * 1024
+        for _, size, path in sorted(entries):
+            if total <= limit:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+
     def _load_enhanced_pdf(self, file_path):
         try:
-            doc = pymupdf.open(file_path)
-            text_content = []
-            page_contents = []
-            all_tables = []
-            all_images = []
-            page_count = len(doc)
-
-            for page_num in range(page_count):
-                page = doc.load_page(page_num)
-                
-                # Trích xuất văn bản thông thường
-                page_text = page.get_text()
-                
-                # Trích xuất và xử lý hình ảnh
-                page_images = self._extract_images(page, page_num, file_path)
-                all_images.extend(page_images)
-                
-                # Trích xuất và nhận dạng table
-                page_tables = self._extract_tables(page, page_num, file_path)
-                all_tables.extend(page_tables)
-                
-                # Kết hợp tất cả nội dung
-                combined_content = page_text
-                
-                # Thêm mô tả table vào nội dung
-                if page_tables:
-                    table_descriptions = "\n".join([
-                        f"[Table {i+1}]: {table.get('description', 'Extracted table content')}"
-                        for i, table in enumerate(page_tables)
-                    ])
-                    combined_content += f"\n\n--- TABLES ON PAGE {page_num + 1} ---\n{table_descriptions}"
-                
-                # Thêm mô tả hình ảnh vào nội dung
-                if page_images:
-                    image_descriptions = "\n".join([
-                        f"[Image {i+1}]: {img.get('description', 'Extracted image')}"
-                        for i, img in enumerate(page_images)
-                    ])
-                    combined_content += f"\n\n--- IMAGES ON PAGE {page_num + 1} ---\n{image_descriptions}"
-
-                if combined_content.strip():
-                    text_content.append(f"--- Page {page_num + 1} ---\n{combined_content}")
+            # Parse from memory: one sequential read instead of file-backed
+            # seeks for every object MuPDF resolves
+            with pymupdf.open(stream=Path(file_path).read_bytes(), filetype="pdf") as doc:
+                page_contents = []
+                all_tables = []
+                all_images = []
+                page_count = len(doc)
+
+                if self.parallel and page_count > PDF_PAGES_PER_TASK:
+                    pages = self._iter_pdf_pages_parallel(file_path, page_count)
+                else:
+                    pages = self._iter_pdf_pages(doc, file_path)
+
+                for page_num, content, page_tables, page_images in pages:
+                    if not content.strip():
+                        continue
+                    all_tables.extend(page_tables)
+                    all_images.extend(page_images)
                     page_contents.append({
                         'page_number': page_num + 1,
-                        'content': combined_content,
+                        'content': content,
                         'has_tables': len(page_tables) > 0,
                         'has_images': len(page_images) > 0
                     })
 
-            doc.close()
+            # Build the full text straight from the page list instead of
+            # keeping a second per-page copy around until the join
+            formatted_text = '\n\n'.join(
+                f"--- Page {page['page_number']} ---\n{page['content']}"
+                for page in page_contents
+            )
 
             return {
-                'formatted_text': '\n\n'.join(text_content),
+                'formatted_text': formatted_text,
                 'pages': page_contents,
                 'tables': all_tables,
                 'images': all_images,
@@ -127,8 +250,65 @@ class DocumentLoader:
             logger.error(f"Error reading PDF file {file_path}: {str(e)}")
             raise
 
+    def _iter_pdf_pages(self, doc, file_path):
+        # Yields (page_num, content, tables, images) one page at a time;
+        # pages with no content are skipped by the caller
+        for page_num in range(len(doc)):
+            yield (page_num, *self._process_page(doc.load_page(page_num), page_num, file_path))
+
+    def _iter_pdf_pages_parallel(self, file_path, page_count):
+        # OCR and table detection are CPU-bound, so page ranges go to worker
+        # processes; results are consumed in page order. Every task reads and
+        # opens the whole PDF, so each worker gets one contiguous range
+        pages_per_task = max(PDF_PAGES_PER_TASK, -(-page_count // DOCUMENT_LOADER_WORKERS))
+        futures = [
+            _get_process_pool().submit(
+                _process_pages_in_worker, str(file_path),
+                range(start, min(start + pages_per_task, page_count))
+            )
+            for start in range(0, page_count, pages_per_task)
+        ]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _process_page(self, page, page_num, file_path):
+        # Trích xuất văn bản thông thường
+        page_text = page.get_text()
+
+        # Trích xuất và xử lý hình ảnh
+        page_images = self._extract_images(page, page_num, file_path)
+
+        # Trích xuất và nhận dạng table
+        page_tables = self._extract_tables(page, page_num, file_path, page_text)
+
+        # Kết hợp tất cả nội dung
+        combined_content = page_text
+
+        # Thêm mô tả table vào nội dung
+        if page_tables:
+            table_descriptions = "\n".join([
+                f"[Table {i+1}]: {table.get('description', 'Extracted table content')}"
+                for i, table in enumerate(page_tables)
+            ])
+            combined_content += f"\n\n--- TABLES ON PAGE {page_num + 1} ---\n{table_descriptions}"
+
+        # Thêm mô tả hình ảnh vào nội dung
+        if page_images:
+            image_descriptions = "\n".join([
+                f"[Image {i+1}]: {img.get('description', 'Extracted image')}"
+                for i, img in enumerate(page_images)
+            ])
+            combined_content += f"\n\n--- IMAGES ON PAGE {page_num + 1} ---\n{image_descriptions}"
+
+        return combined_content, page_tables, page_images
+
     def _extract_images(self, page, page_num, file_path):
         images = []
+        pending = []
         try:
             image_list = page.get_images()
             
@@ -137,114 +317,229 @@ class DocumentLoader:
                     xref = img[0]
                     pix = pymupdf.Pixmap(page.parent, xref)
                     
-                    if pix.n - pix.alpha < 4:  # Kiểm tra CMYK
+                    if pix.n - pix.alpha > 3:  # Kiểm tra CMYK
                         pix = pymupdf.Pixmap(pymupdf.csRGB, pix)
+                    if pix.alpha:
+                        pix = pymupdf.Pixmap(pix, 0)
                     
-                    img_data = pix.tobytes("png")
+                    # Raw samples go straight to PIL; no PNG encode/decode
+                    samples = pix.samples
+                    image = Image.frombytes("L" if pix.n == 1 else "RGB", (pix.width, pix.height), samples)
                     pix = None
                     
-                    # Sử dụng OCR để mô tả hình ảnh
-                    description = self._describe_image_with_ocr(img_data)
-                    
                     images.append({
                         'page_number': page_num + 1,
                         'image_index': img_index,
-                        'description': description,
-                        'size': len(img_data),
+                        'size': len(samples),
                         'type': 'embedded'
                     })
+                    pending.append((hashlib.blake2b(samples, digest_size=16).digest(), image))
                     
                 except Exception as e:
                     logger.warning(f"Error processing image {img_index} on page {page_num}: {str(e)}")
                     continue
+
+            # Sử dụng OCR để mô tả hình ảnh
+            descriptions = self._describe_images_with_ocr(pending)
+            for image, description in zip(images, descriptions):
+                image['description'] = description
                     
         except Exception as e:
             logger.warning(f"Error extracting images from page {page_num}: {str(e)}")
             
         return images
 
-    def _describe_image_with_ocr(self, image_data):
+    def _get_ocr_api(self, lang):
+        api = self._ocr_apis.get(lang)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=lang)
+            self._ocr_apis[lang] = api
+        return api
+
+    def _ocr(self, image, lang='eng'):
+        # tesserocr keeps Tesseract and its language data loaded between calls;
+        # pytesseract starts a new tesseract process for every image
+        if tesserocr is None:
+            return pytesseract.image_to_string(image, lang=lang)
+
+        if not isinstance(image, Image.Image):
+            if image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            image = Image.fromarray(image)
+        with self._ocr_lock:
+            api = self._get_ocr_api(lang)
+            api.SetImage(image)
+            return api.GetUTF8Text()
+
+    def _ocr_batch(self, images, lang='eng'):
+        # Greedily group images so each stacked canvas stays under
+        # OCR_BATCH_MAX_HEIGHT; a failed group yields None for its images
+        texts = []
+        group, group_height = [], OCR_BATCH_PADDING
+        for image in images + [None]:
+            image_height = 0 if image is None else image.height + OCR_BATCH_PADDING
+            if group and (image is None or group_height + image_height > OCR_BATCH_MAX_HEIGHT):
+                try:
+                    texts.extend(self._ocr_canvas(group, lang))
+                except Exception as e:
+                    logger.warning(f"Batch OCR failed for {len(group)} images: {str(e)}")
+                    texts.extend([None] * len(group))
+                group, group_height = [], OCR_BATCH_PADDING
+            if image is not None:
+                group.append(image)
+                group_height += image_height
+        return texts
+
+    def _ocr_canvas(self, images, lang):
+        # Stack the images on one canvas and run Tesseract once, then give each
+        # recognized line to the image whose band contains its centre
+        width = max(image.width for image in images)
+        height = sum(image.height for image in images) + OCR_BATCH_PADDING * (len(images) + 1)
+        canvas = Image.new('L', (width, height), 255)
+
+        band_starts, band_ends = [], []
+        y = OCR_BATCH_PADDING
+        for image in images:
+            canvas.paste(image.convert('L'), (0, y))
+            band_starts.append(y)
+            band_ends.append(y + image.height)
+            y += image.height + OCR_BATCH_PADDING
+
+        level = tesserocr.RIL.TEXTLINE
+        texts = [[] for _ in images]
+        with self._ocr_lock:
+            api = self._get_ocr_api(lang)
+            api.SetPageSegMode(tesserocr.PSM.SPARSE_TEXT)
+            try:
+                api.SetImage(canvas)
+                api.Recognize()
+                for line in tesserocr.iterate_level(api.GetIterator(), level):
+                    text = line.GetUTF8Text(level)
+                    box = line.BoundingBox(level)
+                    if not text or box is None:
+                        continue
+                    centre = (box[1] + box[3]) / 2
+                    i = bisect.bisect_right(band_starts, centre) - 1
+                    if i >= 0 and centre < band_ends[i]:
+                        texts[i].append(text.strip())
+            finally:
+                api.SetPageSegMode(tesserocr.PSM.AUTO)
+        return ["\n".join(lines) for lines in texts]
+
+    def close(self):
+        with self._ocr_lock:
+            for api in self._ocr_apis.values():
+                api.End()
+            self._ocr_apis.clear()
+
+    def __del__(self):
         try:
-            # Chuyển đổi dữ liệu ảnh thành PIL Image
-            image = Image.open(io.BytesIO(image_data))
+            self.close()
+        except Exception:
+            pass
 
-            text = pytesseract.image_to_string(image, lang='eng+vie')
-            
-            if text.strip():
-                return f"OCR text: {text.strip()[:200]}..."
-            else:
-                return "Image contains no detectable text"
+    def _describe_images_with_ocr(self, images):
+        # images: (content hash, PIL image) pairs. Logos and page frames
+        # repeat across pages; OCR each image once
+        with self._ocr_cache_lock:
+            descriptions = [self._ocr_cache.get(key) for key, _ in images]
+        misses = [i for i, description in enumerate(descriptions) if description is None]
+        if not misses:
+            return descriptions
+
+        texts = None
+        if tesserocr is not None and len(misses) > 1:
+            try:
+                texts = self._ocr_batch([images[i][1] for i in misses], lang='eng+vie')
+            except Exception as e:
+                logger.warning(f"Batch OCR failed, falling back to per-image OCR: {str(e)}")
+
+        for n, i in enumerate(misses):
+            key, image = images[i]
+            if texts is None or texts[n] is None:
+                descriptions[i] = self._describe_image_with_ocr(key, image)
+                continue
+            descriptions[i] = self._format_ocr_description(texts[n])
+            self._cache_ocr_description(key, descriptions[i])
+        return descriptions
+
+    def _describe_image_with_ocr(self, key, image):
+        with self._ocr_cache_lock:
+            description = self._ocr_cache.get(key)
+            if description is not None:
+                self._ocr_cache.move_to_end(key)
+                return description
+
+        try:
+            description = self._format_ocr_description(self._ocr(image, lang='eng+vie'))
                 
         except Exception as e:
             logger.warning(f"OCR failed: {str(e)}")
             return "Image (content not extracted)"
 
-    def _extract_tables(self, page, page_num, file_path):
+        self._cache_ocr_description(key, description)
+        return description
+
+    @staticmethod
+    def _format_ocr_description(text):
+        if text.strip():
+            return f"OCR text: {text.strip()[:200]}..."
+        return "Image contains no detectable text"
+
+    def _cache_ocr_description(self, key, description):
+        with self._ocr_cache_lock:
+            self._ocr_cache[key] = description
+            if len(self._ocr_cache) > OCR_CACHE_SIZE:
+                self._ocr_cache.popitem(last=False)
+
+    def _extract_tables(self, page, page_num, file_path, page_text=None):
         tables = []
         try:
-            text = page.get_text("dict")
-            
-            for block in text.get("blocks", []):
-                if block.get("type") == 1:  # Block type 1 thường là image/table
-                    bbox = block.get("bbox", [])
-                    if self._is_likely_table(bbox, block):
-                        table_text = self._extract_table_text(block)
-                        if table_text:
-                            tables.append({
-                                'page_number': page_num + 1,
-                                'bbox': bbox,
-                                'content': table_text,
-                                'type': 'structured',
-                                'description': f"Structured table: {table_text[:100]}..."
-                            })
-            
-            cv_tables = self._detect_tables_with_cv(page, page_num)
-            tables.extend(cv_tables)
+            # PyMuPDF's native detector returns cells directly for vector tables
+            for table in page.find_tables(strategy="lines_strict"):
+                rows = table.extract()
+                table_text = "\n".join(
+                    " | ".join(cell or "" for cell in row) for row in rows
+                ).strip()
+                if table_text:
+                    tables.append({
+                        'page_number': page_num + 1,
+                        'bbox': list(table.bbox),
+                        'content': table_text,
+                        'type': 'structured',
+                        'description': f"Structured table: {table_text[:100]}..."
+                    })
+
+            # Render + Hough + OCR only for pages that look scanned
+            if page_text is None:
+                page_text = page.get_text()
+            if not tables and len(page_text.strip()) < SCANNED_PAGE_MAX_CHARS:
+                tables.extend(self._detect_tables_with_cv(page, page_num))
             
         except Exception as e:
             logger.warning(f"Error extracting tables from page {page_num}: {str(e)}")
             
         return tables
 
-    def _is_likely_table(self, bbox, block):
-        if len(bbox) != 4:
-            return False
-        width = bbox[2] - bbox[0]
-        height = bbox[3] - bbox[1]
-        return width > 100 and height > 50  # Kích thước tối thiểu
-
-    def _extract_table_text(self, block) -> str:
-        try:
-            lines = []
-            if "lines" in block:
-                for line in block["lines"]:
-                    for span in line.get("spans", []):
-                        text = span.get("text", "").strip()
-                        if text:
-                            lines.append(text)
-            return " | ".join(lines) if lines else ""
-        except Exception:
-            return ""
-
     def _detect_tables_with_cv(self, page, page_num):
         tables = []
         try:
-            # Chuyển trang PDF thành ảnh
-            pix = page.get_pixmap(matrix=pymupdf.Matrix(2, 2))
-            img_data = pix.tobytes("png")
-            
-            # Chuyển đổi sang OpenCV format
-            nparr = np.frombuffer(img_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            # Chuyển trang PDF thành ảnh xám; the raw samples are used as-is,
+            # with no PNG encode/decode round trip
+            pix = page.get_pixmap(matrix=pymupdf.Matrix(2, 2), colorspace=pymupdf.csGRAY, alpha=False)
+            gray = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
             
             # Phát hiện đường thẳng (để tìm table grid)
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+            # Pages of one document share a size, so the edge map is reused
+            edges_buf = getattr(self._local, 'edges_buf', None)
+            if edges_buf is None or edges_buf.shape != gray.shape:
+                edges_buf = self._local.edges_buf = np.empty_like(gray)
+            edges = cv2.Canny(gray, 50, 150, edges=edges_buf, apertureSize=3)
             lines = cv2.HoughLinesP(edges, 1, np.pi/180, threshold=100, 
                                   minLineLength=50, maxLineGap=10)
             
             if lines is not None and len(lines) > 10:
-                table_text = self._ocr_table_area(img)
+                table_text = self._ocr_table_area(gray)
                 tables.append({
                     'page_number': page_num + 1,
                     'type': 'detected_grid',
@@ -260,33 +555,60 @@ class DocumentLoader:
     def _ocr_table_area(self, img):
         try:
             # Sử dụng OCR để trích xuất text từ vùng ảnh
-            text = pytesseract.image_to_string(img)
+            text = self._ocr(img)
             return text.strip() if text.strip() else "Table content (no text extracted)"
         except Exception:
             return "Table content (OCR failed)"
 
-    def load_documents(self, directory_path: str) -> List[Dict[str, Any]]:
+    def list_documents(self, directory_path) -> List[Path]:
         directory_path = Path(directory_path)
-        documents = []
 
         if not directory_path.exists():
             logger.warning(f"Directory not found: {directory_path}")
-            return documents
+            return []
 
         pdf_files = list(directory_path.rglob('*.pdf'))
-        
+
         if not pdf_files:
             logger.info(f"No PDF files found in {directory_path}")
-            return documents
+        return pdf_files
 
-        for file_path in pdf_files:
-            try:
-                doc = self.load_document(file_path)
-                documents.append(doc)
-                logger.info(f"Loaded PDF: {file_path.name} "
-                          f"({doc['metadata']['page_count']} pages, "
-                          f"{len(doc['tables'])} tables, "
-                          f"{len(doc['images'])} images)")
-            except Exception as e:
-                logger.error(f"Failed to load {file_path.name}: {str(e)}")
-        return documents
\ No newline at end of file
+    def iter_documents(self, file_paths):
+        # Yields (file_path, document) in input order; document is None when
+        # the file failed to load
+        file_paths = list(file_paths)
+
+        if not self.parallel or len(file_paths) <= 1:
+            for file_path in file_paths:
+                try:
+                    yield file_path, self.load_document(file_path)
+                except Exception as e:
+                    logger.error(f"Failed to load {Path(file_path).name}: {str(e)}")
+                    yield file_path, None
+            return
+
+        futures = [_get_process_pool().submit(_load_document_in_worker, str(file_path))
+                   for file_path in file_paths]
+        try:
+            for file_path, future in zip(file_paths, futures):
+                try:
+                    yield file_path, future.result()
+                except Exception as e:
+                    logger.error(f"Failed to load {Path(file_path).name}: {str(e)}")
+                    yield file_path, None
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def load_documents(self, directory_path: str) -> List[Dict[str, Any]]:
+        documents = []
+        pdf_files = self.list_documents(directory_path)
+
+        for file_path, doc in self.iter_documents(pdf_files):
+            if doc is None:
+                continue
+            documents.append(doc)
+            logger.info("Loaded PDF: %s (%s pages, %d tables, %d images)",
+                        file_path.name, doc['metadata']['page_count'],
+                        len(doc['tables']), len(doc['images']))
+        return documents
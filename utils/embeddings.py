@@ -1,24 +1,42 @@
+import os
+import functools
+import hashlib
+import sqlite3
+import threading
 from typing import List, Dict, Any
+
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+import torch
 from sentence_transformers import SentenceTransformer
 import numpy as np
 import logging
-from config import EMBEDDING_MODEL
+from config import EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE
+from config import ENABLE_CHUNK_EMBEDDING_CACHE, CHUNK_EMBEDDING_CACHE_PATH
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# SQLite's default limit on bound parameters is 999
+CACHE_LOOKUP_BATCH = 900
+
 
 class EmbeddingManager:
     def __init__(self):
         model_name = EMBEDDING_MODEL.split('/')[-1] if '/' in EMBEDDING_MODEL else EMBEDDING_MODEL 
         self.model_name = model_name
         self.model = None
+        self._cache_db = None
+        self._cache_lock = threading.Lock()
         self._load_model()
 
     def _load_model(self):
         try:
             logger.info(f"Loading embedding model: {self.model_name}")
-            self.model = SentenceTransformer(self.model_name, trust_remote_code=True)
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            self.model = SentenceTransformer(self.model_name, device=device, trust_remote_code=True)
+            if device == "cuda":
+                # fp16 weights use the tensor cores; outputs are cast back to float32
+                self.model.half()
             logger.info("Embedding model loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load embedding model: {str(e)}")
@@ -29,8 +47,12 @@ class EmbeddingManager:
             raise RuntimeError("Embedding model not loaded")
 
         try:
-            embedding = self.model.encode(text, convert_to_tensor=False)
-            return embedding.tolist()
+            embedding = self.model.encode(
+                text,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+            return embedding.astype(np.float32, copy=False)
         except Exception as e:
             logger.error(f"Error generating embedding: {str(e)}")
             raise
@@ -40,12 +62,91 @@ class EmbeddingManager:
             raise RuntimeError("Embedding model not loaded")
 
         try:
-            embeddings = self.model.encode(texts, convert_to_tensor=False, show_progress_bar=True)
-            return embeddings.tolist()
+            return self._encode_cached(texts, batch_size=EMBEDDING_BATCH_SIZE, show_progress_bar=True)
         except Exception as e:
             logger.error(f"Error generating embeddings: {str(e)}")
             raise
 
+    def embed_batch(self, texts, batch_size=EMBEDDING_BATCH_SIZE):
+        if not self.model:
+            raise RuntimeError("Embedding model not loaded")
+
+        try:
+            return self._encode_cached(texts, batch_size=batch_size, show_progress_bar=False)
+        except Exception as e:
+            logger.error(f"Error generating batch embeddings: {str(e)}")
+            raise
+
+    def _encode_cached(self, texts, **encode_kwargs):
+        # Only texts not seen before (for this model) go through the encoder
+        keys = [self._cache_key(text) for text in texts]
+        cached = self._cache_lookup(keys) if ENABLE_CHUNK_EMBEDDING_CACHE else {}
+        misses = [i for i, key in enumerate(keys) if key not in cached]
+
+        new_embeddings = None
+        if misses:
+            new_embeddings = self.model.encode(
+                [texts[i] for i in misses],
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                **encode_kwargs
+            ).astype(np.float32, copy=False)
+            if ENABLE_CHUNK_EMBEDDING_CACHE:
+                self._cache_store([keys[i] for i in misses], new_embeddings)
+            if len(misses) == len(texts):
+                return new_embeddings
+
+        embeddings = np.empty((len(texts), self.get_embedding_dimension()), dtype=np.float32)
+        for i, key in enumerate(keys):
+            if key in cached:
+                embeddings[i] = np.frombuffer(cached[key], dtype=np.float32)
+        if misses:
+            embeddings[misses] = new_embeddings
+        return embeddings
+
+    def _cache_key(self, text):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(self.model_name.encode())
+        digest.update(b"\0")
+        digest.update(text.encode())
+        return digest.digest()
+
+    def _get_cache_db(self):
+        if self._cache_db is None:
+            db = sqlite3.connect(str(CHUNK_EMBEDDING_CACHE_PATH), check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, embedding BLOB)")
+            self._cache_db = db
+        return self._cache_db
+
+    def _cache_lookup(self, keys):
+        try:
+            with self._cache_lock:
+                db = self._get_cache_db()
+                found = {}
+                for start in range(0, len(keys), CACHE_LOOKUP_BATCH):
+                    batch = keys[start:start + CACHE_LOOKUP_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    found.update(db.execute(
+                        f"SELECT key, embedding FROM embeddings WHERE key IN ({placeholders})", batch
+                    ))
+                return found
+        except Exception as e:
+            logger.warning(f"Embedding cache lookup failed: {str(e)}")
+            return {}
+
+    def _cache_store(self, keys, embeddings):
+        try:
+            with self._cache_lock:
+                db = self._get_cache_db()
+                with db:
+                    db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, embedding) VALUES (?, ?)",
+                        zip(keys, (row.tobytes() for row in embeddings))
+                    )
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {str(e)}")
+
     def embed_documents(self, documents):
         if not documents:
             return []
@@ -78,3 +179,9 @@ class EmbeddingManager:
 
     #     top_indices = np.argsort(similarities)[::-1][:top_k]
     #     return top_indices.tolist()
+
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_manager():
+    # Share one loaded model across RAGChatbot instances
+    return EmbeddingManager()
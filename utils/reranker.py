@@ -1,7 +1,9 @@
+import functools
 import logging
+import numpy as np
+import torch
 from sentence_transformers import CrossEncoder
-from config import RERANKER_MODEL
-logging.basicConfig(level=logging.INFO)
+from config import RERANKER_MODEL, RERANKER_BATCH_SIZE
 logger = logging.getLogger(__name__)
 
 class Reranker:
@@ -13,38 +15,50 @@ class Reranker:
     def _load_model(self):
         try:
             logger.info(f"Loading reranker model: {self.model_name}")
-            self.model = CrossEncoder(self.model_name)
+            self.model = self._create_model(self.model_name)
             logger.info("Reranker model loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load reranker model: {str(e)}")
             # Fallback to a smaller model if available
             try:
                 self.model_name = "cross-encoder/ms-marco-TinyBERT-L-2-v2"
-                self.model = CrossEncoder(self.model_name)
+                self.model = self._create_model(self.model_name)
                 logger.info("Fallback reranker model loaded successfully")
             except Exception as e2:
                 logger.error(f"Failed to load fallback reranker model: {str(e2)}")
                 self.model = None
 
+    @staticmethod
+    def _create_model(model_name):
+        # Half precision on GPU; CPU inference stays in fp32. Converted after
+        # loading since older sentence-transformers reject model_kwargs
+        if torch.cuda.is_available():
+            model = CrossEncoder(model_name, device="cuda")
+            model.model.half()
+            return model
+        return CrossEncoder(model_name)
+
     def rerank(self, query, documents, top_k = 5):
         if not self.model or not documents:
             return documents[:top_k]
 
         try:
-            # Chuẩn bị cặp query-document cho re-ranker
-            pairs = [(query, doc['content']) for doc in documents]
+            # Chuẩn bị cặp query-document cho re-ranker, sorted by length so
+            # each batch pads to similar-sized pairs
+            order = np.argsort([len(doc['content']) for doc in documents], kind='stable')
+            pairs = [(query, documents[i]['content']) for i in order]
             
             # Dự đoán điểm relevance
-            scores = self.model.predict(pairs)
-            
-            # Kết hợp điểm với documents
-            scored_docs = list(zip(scores, documents))
-            
-            # Sắp xếp theo điểm giảm dần
-            scored_docs.sort(key=lambda x: x[0], reverse=True)
+            with torch.inference_mode():
+                sorted_scores = self.model.predict(
+                    pairs, batch_size=RERANKER_BATCH_SIZE, show_progress_bar=False
+                )
+            scores = np.empty(len(documents), dtype=np.float32)
+            scores[order] = sorted_scores
             
-            # Lấy top_k documents
-            reranked_docs = [doc for score, doc in scored_docs[:top_k]]
+            # Sắp xếp theo điểm giảm dần và lấy top_k documents
+            ranked = np.argsort(-scores, kind='stable')[:top_k]
+            reranked_docs = [documents[i] for i in ranked]
             
             logger.info(f"Reranked {len(documents)} documents to top {len(reranked_docs)}")
             return reranked_docs
@@ -54,4 +68,10 @@ class Reranker:
             return documents[:top_k]
 
     def is_available(self):
-        return self.model is not None
\ No newline at end of file
+        return self.model is not None
+
+
+@functools.lru_cache(maxsize=None)
+def get_reranker(model_name=RERANKER_MODEL):
+    # Share one loaded model across RAGChatbot instances
+    return Reranker(model_name)
@@ -1,42 +1,61 @@
 # text_processor.py
+import functools
 import re
+from collections import Counter
 from typing import List, Dict, Any
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import logging
 from config import CHUNK_SIZE, CHUNK_OVERLAP
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DISALLOWED_CHARS_PATTERN = re.compile(r'[^\w\s\.\,\!\?\;\:\-\(\)]')
+REPEATED_PUNCT_PATTERN = re.compile(r'([.!?]){2,}')
+KEYWORD_PATTERN = re.compile(r'\b[a-zA-Z]{3,}\b')
+KEYWORD_STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
+    'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have',
+    'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should'
+})
+
+
+SECTION_PATTERNS = tuple(re.compile(pattern, re.MULTILINE) for pattern in (
+    r'^(?:Section|§)\s*([IVXLCDMivxlcdm]+|\d+)',
+    r'^(\d+\.\d+)\s',
+    r'^[IVXLCDM]+\.',
+    r'^[A-Z][A-Z\s]+\n',
+    r'^\d+\.\s+[A-Z]',
+))
+
+
+@functools.lru_cache(maxsize=None)
+def get_text_splitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    # The splitter is stateless; share one per configuration
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""]
+    )
+
 
 class TextProcessor:
     def __init__(self):
         self.chunk_size = CHUNK_SIZE
         self.chunk_overlap = CHUNK_OVERLAP
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
-
-        self.section_patterns = [
-            r'^(?:Section|§)\s*([IVXLCDMivxlcdm]+|\d+)',  
-            r'^(\d+\.\d+)\s',  
-            r'^[IVXLCDM]+\.',  
-            r'^[A-Z][A-Z\s]+\n',  
-            r'^\d+\.\s+[A-Z]',  
-        ]
+        self.text_splitter = get_text_splitter(CHUNK_SIZE, CHUNK_OVERLAP)
+        self.section_patterns = SECTION_PATTERNS
 
     def clean_text(self, text):
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)]', '', text)
-        text = re.sub(r'([.!?]){2,}', r'\1', text)
+        # str.split() collapses the same whitespace as \s+ in one C-level pass
+        text = ' '.join(text.split())
+        text = DISALLOWED_CHARS_PATTERN.sub('', text)
+        text = REPEATED_PUNCT_PATTERN.sub(r'\1', text)
         return text.strip()
 
     def detect_section(self, text):
         for pattern in self.section_patterns:
-            match = re.search(pattern, text, re.MULTILINE)
+            match = pattern.search(text)
             if match:
                 return match.group(0).strip()
         return None
@@ -96,17 +115,10 @@ class TextProcessor:
         return all_chunks
 
     def extract_keywords(self, text, max_keywords=10):
-        stop_words = {
-            'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
-            'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have',
-            'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should'
-        }
-
-        words = re.findall(r'\b[a-zA-Z]{3,}\b', text.lower())
-        word_freq = {}
-        for word in words:
-            if word not in stop_words:
-                word_freq[word] = word_freq.get(word, 0) + 1
-
-        keywords = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-        return [word for word, freq in keywords[:max_keywords]]
\ No newline at end of file
+        counts = Counter(
+            word for word in KEYWORD_PATTERN.findall(text.lower())
+            if word not in KEYWORD_STOP_WORDS
+        )
+        # most_common(n) is a heap selection with the same tie order as the
+        # full sort it replaces
+        return [word for word, _ in counts.most_common(max_keywords)]
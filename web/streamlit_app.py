@@ -1,16 +1,20 @@
 import streamlit as st
 import sys
-import os
 from pathlib import Path
 import tempfile
+import hashlib
 import time
 from datetime import datetime
-import json
+import orjson
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 sys.path.append(str(Path(__file__).parent.parent))
 
 from rag.chatbot import RAGChatbot
-from config import DOCUMENTS_DIR
+from config import DOCUMENTS_DIR, MAX_UPLOAD_SIZE_MB
+
+logging.basicConfig(level=logging.INFO)
 
 st.set_page_config(
     page_title="RAG PDF Chatbot",
@@ -19,99 +23,68 @@ st.set_page_config(
 )
 
 collection_name = "rag_documents"
+CHAT_TOP_K = 5
+UPLOAD_SAVE_WORKERS = 8
+STREAM_REFRESH_SECONDS = 0.05
+HISTORY_WINDOW = 20
+
+SOURCE_CARD = """
+<div class="source-card">
+    <strong>{index}. {filename}</strong><br>
+    <small>Relevance: {relevance}</small><br>
+    <em>Content: {preview}...</em>
+</div>
+"""
+HISTORY_SOURCE_CARD = """
+<div class="source-card">
+    <strong>{index}. {filename}</strong><br>
+    <small>Size: {file_size} bytes | 
+    Pages: {page_count}</small>
+</div>
+"""
 
 @st.cache_resource
 def init_chatbot(collection_name):
     return RAGChatbot(collection_name=collection_name)
 
+@st.cache_data(ttl=5)
+def get_document_count(_chatbot, collection_name, db_version):
+    # Chroma's count() is only re-queried after this session changes the
+    # collection (db_version) or when the TTL lapses
+    return _chatbot.get_database_info().get('document_count', 0)
+
+def bump_db_version():
+    st.session_state.db_version += 1
+
+def bump_messages_version():
+    # Monotonic per session; keys the chat export cache
+    st.session_state.messages_version += 1
+
 if 'messages' not in st.session_state:
     st.session_state.messages = []
+if 'messages_version' not in st.session_state:
+    st.session_state.messages_version = 0
+if 'db_version' not in st.session_state:
+    st.session_state.db_version = 0
 if 'processing' not in st.session_state:
     st.session_state.processing = False
+if 'ingested_uploads' not in st.session_state:
+    # Content hashes of the files this session has ingested
+    st.session_state.ingested_uploads = set()
 
 def main():
+    # Success messages set before a st.rerun() are shown on the next run;
+    # st.toast dismisses itself, so the action no longer sleeps for them
+    if message := st.session_state.pop("flash", None):
+        st.toast(message, icon="✅")
+
     st.markdown('RAG PDF Chatbot')
     st.markdown("**Chat intelligently with your PDF documents!**")
     
     chatbot = init_chatbot(collection_name)
 
     with st.sidebar:
-        st.header("Document Management")
-        
-        collection_name_input = st.text_input(
-        "Collection Name", 
-        value=collection_name,
-        help="Enter a name for this document collection"
-        )
-
-        with st.container():
-            st.subheader("Upload PDF files")
-            uploaded_files = st.file_uploader(
-                "Choose PDF files",
-                type=['pdf'],
-                accept_multiple_files=True,
-                help="Only support PDF files"
-            )
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("Process file", disabled=st.session_state.processing):
-                    if uploaded_files:
-                        process_uploaded_files(uploaded_files, chatbot, collection_name_input)
-                    else:
-                        st.warning("Please select PDF file!")
-            
-            with col2:
-                if st.button("Load from Folder"):
-                    load_from_directory(chatbot)
-        
-        st.divider()
-        
-        st.subheader("Database Info")
-        col1, col2 = st.columns(2)
-        doc_metric = col1.empty()
-        chat_metric = col2.empty()
-        status_placeholder = st.empty()   
-
-        def refresh_db_info():
-            info = chatbot.get_database_info()
-            doc_metric.metric("Document", info.get('document_count', 0))
-            chat_metric.metric("Chat History", info.get('chat_history_length', 0))
-
-            if info.get('is_initialized', False):
-                status_placeholder.success("Ready to chat!")
-            else:
-                status_placeholder.warning("No document available!")
-
-        refresh_db_info()
-   
-        st.divider()
-        
-        st.subheader("Actions")
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("Clear chat", disabled=st.session_state.processing):
-                clear_chat_history(chatbot)
-        
-        with col2:
-            if st.button("Clear DB", type="secondary", disabled=st.session_state.processing):
-                clear_database(chatbot)
-        
-        if chatbot.chat_history:
-            if st.button("Export Chat History", disabled=st.session_state.processing):
-                export_chat_history()
-        
-        st.divider()
-        
-        # Tips
-        with st.expander("Usage Tips"):
-            st.markdown("""
-            - **Upload PDF**: You can upload multiple PDFs at once  
-            - **Ask Questions**: Query the content inside the documents  
-            - **Check Sources**: Click "Sources" to see citations  
-            - **Export Chat**: Save the conversation to a JSON file
-            """)
+        sidebar_panel(chatbot)
 
     if not chatbot.is_initialized:
         st.info("Please upload PDF documents or load from folder to start chatting!")
@@ -126,69 +99,232 @@ def main():
             st.info("Provide conclusions from the content")
         return
 
+    chat_panel(chatbot)
+
+# Sidebar widgets (uploader, export) rerun only this function; actions that
+# change the documents or the chat call st.rerun() for the whole app
+@st.fragment
+def sidebar_panel(chatbot):
+    st.header("Document Management")
+    
+    collection_name_input = st.text_input(
+    "Collection Name", 
+    value=collection_name,
+    help="Enter a name for this document collection"
+    )
+
+    with st.container():
+        st.subheader("Upload PDF files")
+        uploaded_files = st.file_uploader(
+            "Choose PDF files",
+            type=['pdf'],
+            accept_multiple_files=True,
+            help="Only support PDF files"
+        )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Process file", disabled=st.session_state.processing):
+                if uploaded_files:
+                    process_uploaded_files(uploaded_files, chatbot)
+                else:
+                    st.warning("Please select PDF file!")
+        
+        with col2:
+            if st.button("Load from Folder"):
+                load_from_directory(chatbot)
+    
+    st.divider()
+    
+    st.subheader("Database Info")
+    col1, col2 = st.columns(2)
+    doc_metric = col1.empty()
+    chat_metric = col2.empty()
+    status_placeholder = st.empty()   
+
+    def refresh_db_info():
+        doc_metric.metric(
+            "Document",
+            get_document_count(chatbot, chatbot.retriever.collection_name, st.session_state.db_version)
+        )
+        # Remembered so chat_panel knows when this metric has gone stale
+        st.session_state.sidebar_chat_count = len(chatbot.chat_history)
+        chat_metric.metric("Chat History", st.session_state.sidebar_chat_count)
+
+        if chatbot.is_initialized:
+            status_placeholder.success("Ready to chat!")
+        else:
+            status_placeholder.warning("No document available!")
+
+    refresh_db_info()
+   
+    st.divider()
+    
+    st.subheader("Actions")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Clear chat", disabled=st.session_state.processing):
+            clear_chat_history(chatbot)
+    
+    with col2:
+        if st.button("Clear DB", type="secondary", disabled=st.session_state.processing):
+            clear_database(chatbot)
+    
+    if st.session_state.messages:
+        if st.button("Export Chat History", disabled=st.session_state.processing):
+            export_chat_history()
+    
+    st.divider()
+    
+    # Tips
+    with st.expander("Usage Tips"):
+        st.markdown("""
+        - **Upload PDF**: You can upload multiple PDFs at once  
+        - **Ask Questions**: Query the content inside the documents  
+        - **Check Sources**: Click "Sources" to see citations  
+        - **Export Chat**: Save the conversation to a JSON file
+        """)
+
+# Reruns triggered inside the chat (new messages) replay only this function,
+# not the sidebar or the header
+@st.fragment
+def chat_panel(chatbot):
+    messages = st.session_state.messages
+    # Only the latest `window` messages are rendered on each rerun; each
+    # click pages in another HISTORY_WINDOW older ones
+    window = st.session_state.get("history_window", HISTORY_WINDOW)
+    if len(messages) > window and st.button(f"Load earlier messages ({len(messages) - window})"):
+        window += HISTORY_WINDOW
+        st.session_state.history_window = window
+    visible = messages[-window:]
+
     chat_container = st.container()
     with chat_container:
-        for i, message in enumerate(st.session_state.messages):
+        for message in visible:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
                 
-                if message["role"] == "assistant" and "sources" in message and message["sources"]:
+                if message.get("sources_html"):
                     with st.expander(f"Sources ({len(message['sources'])} documents)"):
-                        for j, source in enumerate(message["sources"], 1):
-                            st.markdown(f"""
-                            <div class="source-card">
-                                <strong>{j}. {source.get('filename', 'Unknown')}</strong><br>
-                                <small>Size: {source.get('file_size', 'N/A')} bytes | 
-                                Pages: {source.get('page_count', 'N/A')}</small>
-                            </div>
-                            """, unsafe_allow_html=True)
+                        st.markdown(message["sources_html"], unsafe_allow_html=True)
 
     if prompt := st.chat_input("Ask about your PDF documents..."):
         st.session_state.messages.append({"role": "user", "content": prompt})
+        bump_messages_version()
         
         with st.chat_message("user"):
             st.markdown(prompt)
         
         with st.chat_message("assistant"):
-            message_placeholder = st.empty()
             full_response = ""
             
-            sources = chatbot.get_relevant_sources(prompt, top_k=3)
+            # Retrieve once and hand the results to stream_chat as its context;
+            # show the best three
+            relevant_docs = chatbot.get_relevant_sources(prompt, top_k=CHAT_TOP_K)
+            sources = relevant_docs[:3]
             
             try:
-                for chunk in chatbot.stream_chat(prompt):
-                    full_response += chunk
-                    message_placeholder.markdown(full_response + "▌")
-                
-                message_placeholder.markdown(full_response)
+                full_response = st.write_stream(coalesce_chunks(
+                    chatbot.stream_chat(prompt, top_k=CHAT_TOP_K, context=relevant_docs)
+                ))
                 
                 if sources:
                     with st.expander(f"Source ({len(sources)} documents)"):
-                        for i, source in enumerate(sources, 1):
-                            relevance = (1 - source.get('distance', 0)) * 100
-                            st.markdown(f"""
-                            <div class="source-card">
-                                <strong>{i}. {source['metadata'].get('filename', 'Unknown')}</strong><br>
-                                <small>Relevance: {relevance:.1f}%</small><br>
-                                <em>Content: {source['content'][:150]}...</em>
-                            </div>
-                            """, unsafe_allow_html=True)
+                        st.markdown("".join(
+                            SOURCE_CARD.format(
+                                index=i,
+                                filename=source['metadata'].get('filename', 'Unknown'),
+                                relevance=format_relevance(chatbot.retriever.distance_to_similarity(source.get('distance'))),
+                                preview=source['content'][:150]
+                            )
+                            for i, source in enumerate(sources, 1)
+                        ), unsafe_allow_html=True)
             
             except Exception as e:
                 st.error(f"Error generating response: {str(e)}")
                 full_response = "Sorry, an error occurred while processing your question."
         
+        source_metadata = [s.get('metadata', {}) for s in sources] if sources else []
         st.session_state.messages.append({
             "role": "assistant",
             "content": full_response,
-            "sources": [s.get('metadata', {}) for s in sources] if sources else []
+            "sources": source_metadata,
+            # The cards never change once appended; build their HTML (one
+            # markdown element for all cards) here instead of on every rerun
+            "sources_html": "".join(
+                HISTORY_SOURCE_CARD.format(
+                    index=j,
+                    filename=source.get('filename', 'Unknown'),
+                    file_size=source.get('file_size', 'N/A'),
+                    page_count=source.get('page_count', 'N/A')
+                )
+                for j, source in enumerate(source_metadata, 1)
+            )
         })
-
-        refresh_db_info()
+        bump_messages_version()
 
         st.session_state.processing = False
-        st.rerun()
+        # Rerun the whole app when the sidebar is out of date: this session's
+        # first exchange (Export button appears) or a changed chat count;
+        # otherwise rerun just this fragment
+        sidebar_stale = (len(st.session_state.messages) == 2
+                         or st.session_state.get("sidebar_chat_count") != len(chatbot.chat_history))
+        st.rerun(scope="app" if sidebar_stale else "fragment")
+
+def format_relevance(similarity):
+    # Keyword-only hits from hybrid search carry no semantic distance
+    if similarity is None:
+        return "N/A"
+    return f"{max(0.0, min(100.0, similarity * 100)):.1f}%"
+
+def coalesce_chunks(chunks, interval=STREAM_REFRESH_SECONDS):
+    # st.write_stream redraws once per yielded item; merge tokens so it
+    # redraws at most every `interval` seconds
+    buffer = []
+    last_flush = time.monotonic()
+    for chunk in chunks:
+        buffer.append(chunk)
+        now = time.monotonic()
+        if now - last_flush >= interval:
+            yield "".join(buffer)
+            buffer.clear()
+            last_flush = now
+    if buffer:
+        yield "".join(buffer)
+
+def upload_digest(uploaded_file):
+    return hashlib.blake2b(uploaded_file.getbuffer(), digest_size=16).hexdigest()
+
+def save_uploaded_file(uploaded_file, directory, digest):
+    # One subdirectory per content hash: same-named files do not overwrite
+    # each other, and the loader still sees the original filename
+    file_path = Path(directory) / digest / uploaded_file.name
+    file_path.parent.mkdir(exist_ok=True)
+    with open(file_path, "wb") as f:
+        f.write(uploaded_file.getbuffer())
+    return file_path
+
 def process_uploaded_files(uploaded_files, chatbot):
+    accepted_files = []
+    for uploaded_file in uploaded_files:
+        if uploaded_file.size > MAX_UPLOAD_SIZE_MB * 1024 * 1024:
+            st.error(f"{uploaded_file.name} exceeds the {MAX_UPLOAD_SIZE_MB} MB limit and was skipped.")
+            continue
+        accepted_files.append(uploaded_file)
+
+    # The uploader returns every selected file on each click; only content
+    # not ingested yet goes through parsing and embedding
+    new_files = {}
+    for uploaded_file in accepted_files:
+        digest = upload_digest(uploaded_file)
+        if digest not in st.session_state.ingested_uploads:
+            new_files.setdefault(digest, uploaded_file)
+    if not new_files:
+        if accepted_files:
+            st.info("All selected files have already been processed.")
+        return
+
     st.session_state.processing = True
     
     try:
@@ -197,23 +333,27 @@ def process_uploaded_files(uploaded_files, chatbot):
             status_text = st.empty()
             
             with tempfile.TemporaryDirectory() as temp_dir:
-                for i, uploaded_file in enumerate(uploaded_files):
-                    status_text.text(f"Saving file: {uploaded_file.name}")
-                    progress_bar.progress((i + 1) / (len(uploaded_files) * 2))
-                    
-                    file_path = Path(temp_dir) / uploaded_file.name
-                    with open(file_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
+                # Writes overlap in worker threads; Streamlit elements are only
+                # updated from this thread
+                with ThreadPoolExecutor(max_workers=UPLOAD_SAVE_WORKERS) as executor:
+                    futures = [executor.submit(save_uploaded_file, uploaded_file, temp_dir, digest)
+                               for digest, uploaded_file in new_files.items()]
+                    file_paths = []
+                    for i, future in enumerate(as_completed(futures)):
+                        file_paths.append(str(future.result()))
+                        status_text.text(f"Saved file: {Path(file_paths[-1]).name}")
+                        progress_bar.progress((i + 1) / (len(new_files) * 2))
                 
                 status_text.text("Analyzing and Processing content...")
                 progress_bar.progress(0.75)
                 
-                success = chatbot.load_documents(temp_dir)
+                success = chatbot.load_documents(file_paths)
                 progress_bar.progress(1.0)
                 
                 if success:
-                    st.success(f"Successfully processed {len(uploaded_files)} file PDF!")
-                    time.sleep(1)
+                    st.session_state.ingested_uploads.update(new_files)
+                    bump_db_version()
+                    st.session_state.flash = f"Successfully processed {len(new_files)} file PDF!"
                     st.rerun()
                 else:
                     st.error("Failed to process PDF files!")
@@ -230,8 +370,8 @@ def load_from_directory(chatbot):
             if DOCUMENTS_DIR.exists() and any(DOCUMENTS_DIR.glob('*.pdf')):
                 success = chatbot.load_documents(str(DOCUMENTS_DIR))
                 if success:
-                    st.success("Successfully loaded documents from folder!")
-                    time.sleep(1)
+                    bump_db_version()
+                    st.session_state.flash = "Successfully loaded documents from folder!"
                     st.rerun()
                 else:
                     st.error("Failed to load documents from folder!")
@@ -244,35 +384,47 @@ def load_from_directory(chatbot):
 def clear_chat_history(chatbot):
     chatbot.clear_chat_history()
     st.session_state.messages = []
-    st.success("Chat history cleared!")
-    time.sleep(1)
+    bump_messages_version()
+    st.session_state.pop("history_window", None)
+    st.session_state.flash = "Chat history cleared!"
     st.rerun()
 
 def clear_database(chatbot):
     try:
         chatbot.clear_database()
-        st.success("Database cleared!")
-        time.sleep(1)
+        st.session_state.ingested_uploads.clear()
+        bump_db_version()
+        st.session_state.flash = "Database cleared!"
         st.rerun()
     except Exception as e:
         st.error(f"Error clearing database: {str(e)}")
 
 def export_chat_history():
     try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"chat_history_{timestamp}.json"
-        
-        chat_data = {
-            "export_time": datetime.now().isoformat(),
-            "total_messages": len(st.session_state.messages),
-            "messages": st.session_state.messages
-        }
+        messages = st.session_state.messages
+        # Re-serialize the messages only when one was added since the last
+        # export; the timestamp is stamped on every download
+        cached = st.session_state.get("export_cache")
+        if cached is None or cached[0] != st.session_state.messages_version:
+            messages_json = orjson.dumps(
+                [{k: v for k, v in message.items() if k != "sources_html"} for message in messages],
+                option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+            )
+            # Nest one level deeper; JSON strings never contain a raw newline
+            cached = (st.session_state.messages_version, messages_json.replace(b"\n", b"\n  "))
+            st.session_state.export_cache = cached
         
-        json_str = json.dumps(chat_data, ensure_ascii=False, indent=2)
+        now = datetime.now()
+        filename = f"chat_history_{now.strftime('%Y%m%d_%H%M%S')}.json"
+        json_bytes = b"".join((
+            b'{\n  "export_time": ', orjson.dumps(now.isoformat()),
+            b',\n  "total_messages": ', str(len(messages)).encode(),
+            b',\n  "messages": ', cached[1], b"\n}"
+        ))
         
         st.download_button(
             label="Download Chat History",
-            data=json_str,
+            data=json_bytes,
             file_name=filename,
             mime="application/json"
         )